@@ -0,0 +1,109 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+from users import metrics
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != 'default']
+
+
+def _pin_key(user):
+    return f'replica_pin_{user.pk}'
+
+
+def pin_to_primary(user):
+    """Send the user's reads to the primary for a while, so they always see their own writes."""
+    cache.set(_pin_key(user), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return bool(cache.get(_pin_key(user)))
+
+
+class PrimaryReplicaRouter:
+    """Writes go to ``default``; reads inside a ReadReplicaMixin view go to a random replica when one exists."""
+
+    # noinspection PyMethodMayBeStatic
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    # noinspection PyMethodMayBeStatic
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    # noinspection PyMethodMayBeStatic
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # noinspection PyMethodMayBeStatic
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReadReplicaMixin:
+    """Route the reads of safe requests to replicas unless the user has written recently."""
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Unhandled exceptions skip finalize_response(), so reset here.
+            if self._replica_token:
+                _use_replica.reset(self._replica_token)
+                self._replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Set after authentication, which is_pinned() needs.
+        if request.method in SAFE_METHODS and not is_pinned(request.user):
+            self._replica_token = _use_replica.set(True)
+
+
+class ReplicaPinMiddleware:
+    """Pin users to the primary after any successful write request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and user is not None and user.is_authenticated):
+            pin_to_primary(user)
+        return response
+
+
+@receiver(connection_created)
+def count_new_connection(sender, connection, **kwargs):
+    metrics.incr(f'db.{connection.alias}.connections_opened')
+
+
+def pool_stats():
+    """Configuration and usage of the persistent connection pool of every database alias."""
+    counters = metrics.snapshot()
+    stats = {}
+    for alias in settings.DATABASES:
+        conn = connections[alias]
+        stats[alias] = {
+            'role': 'primary' if alias == 'default' else 'replica',
+            'conn_max_age': conn.settings_dict['CONN_MAX_AGE'],
+            'health_checks': conn.settings_dict['CONN_HEALTH_CHECKS'],
+            'connections_opened': counters.get(f'db.{alias}.connections_opened', 0),
+        }
+    return stats
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -51,7 +53,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'corsheaders.middleware.CorsMiddleware'
+    'corsheaders.middleware.CorsMiddleware',
+    'api.db_router.ReplicaPinMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -91,9 +94,28 @@ DATABASES = {
         'PASSWORD': 'admin',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Keep connections open between requests and check them before reuse.
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas, e.g. DATABASE_REPLICA_HOSTS="replica-1:5432,replica-2:5432". Read-only views are routed to
+# them by api.db_router; everything else, and every read for REPLICA_PIN_SECONDS after a user's write, stays
+# on the primary.
+for i, replica in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica_{i}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.db_router.PrimaryReplicaRouter']
+
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -143,5 +165,67 @@ ACCOUNT_UNIQUE_EMAIL = True
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
-    ]
+    ],
+    # Rates per throttle scope: '<requests>/<period>' over a sliding window, see users/api/throttling.py.
+    'DEFAULT_THROTTLE_RATES': {
+        'chatbot_user': '10/min',
+        'chatbot_global': '300/min',
+        'predict_user': '30/min',
+        'predict_global': '1200/min',
+    },
+}
+
+HEART_DISEASE_MODEL_PATH = BASE_DIR / 'models' / 'trained_model.pkl'
+
+# Candidate model scored off the request path on a sample of predictions, see users/shadow.py. It runs on one
+# thread inside each web worker and competes with request threads for the GIL, so keep the sample small; at most
+# SHADOW_MAX_PENDING predictions wait per worker and the rest are dropped.
+SHADOW_MODEL_PATH = os.environ.get('SHADOW_MODEL_PATH')
+SHADOW_SAMPLE_RATE = 0.1
+SHADOW_MAX_PENDING = 8
+
+# Chatbot sessions: idle sessions expire after CHAT_SESSION_TTL_SECONDS, turns beyond CHAT_CONTEXT_TOKENS are
+# folded into a summary of at most CHAT_SUMMARY_MAX_CHARS, and each user keeps at most CHAT_MAX_SESSIONS_PER_USER.
+# Messages over half of CHAT_CONTEXT_TOKENS are rejected.
+CHAT_SESSION_TTL_SECONDS = 24 * 60 * 60
+CHAT_CONTEXT_TOKENS = 2000
+CHAT_SUMMARY_MAX_CHARS = 2000
+CHAT_MAX_SESSIONS_PER_USER = 20
+
+# Timeouts, retries, hedging and circuit breakers for upstream API calls (users/resilience.py). Breaker state
+# and latency history are kept per process.
+UPSTREAM_POLICIES = {
+    'chat': {'timeout': 20.0, 'retries': 1, 'hedge_percentile': 95, 'failure_threshold': 5, 'reset_timeout': 30.0},
+    'translation': {'timeout': 5.0, 'retries': 2, 'hedge_percentile': 95, 'failure_threshold': 5,
+                    'reset_timeout': 15.0},
+}
+
+# Overall time budget for one chatbot request, covering both translations and the model call.
+CHATBOT_DEADLINE_SECONDS = 30
+
+# Maximum number of concurrent requests per throttle scope.
+MAX_IN_FLIGHT = {
+    'chatbot': 16,
+    'predict': 32,
+}
+
+# Rate limits, in-flight counters and metrics live in the default cache. Point it at a shared backend
+# (e.g. Redis) in production so every worker sees the same state.
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Serialized patient and doctor payloads (users/api/fragments.py). Bounded by MAX_ENTRIES here; use an
+    # LRU-evicting backend (e.g. Redis with maxmemory-policy allkeys-lru) in production.
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
 }
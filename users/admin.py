@@ -1,7 +1,122 @@
-from django.contrib import admin
-from .models import User, Patient, Doctor
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import HttpResponseRedirect
+from django.utils.functional import cached_property
+
+from .models import User, Patient, Doctor, RescoreJob
+from . import rescoring
 # Register your models here.
 
-admin.site.register(User)
-admin.site.register(Patient)
-admin.site.register(Doctor)
+
+def estimated_count(model, using='default'):
+    """Row count from the planner statistics, kept current by autovacuum; 0 if the table was never analyzed."""
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+        row = cursor.fetchone()
+    return max(row[0], 0) if row else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the planner's row estimate instead of ``COUNT(*)`` for unfiltered changelists of large tables. Filtered
+    and searched changelists, and small tables, still get exact counts.
+    """
+    estimate_above = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, using=queryset.db)
+            if estimate > self.estimate_above:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered COUNT(*) behind "N total" next to filtered results.
+    show_full_result_count = False
+
+
+class ProfileAdmin(LargeTableAdmin):
+    """Patients and doctors: ``__str__`` reads ``user.username``, so the user row is always joined in."""
+    raw_id_fields = ['user']
+    search_fields = ['^user__username']
+    ordering = ['pk']
+
+    def get_queryset(self, request):
+        # Also covers the autocomplete endpoint, which does not apply list_select_related.
+        return super().get_queryset(request).select_related('user')
+
+
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ['username', 'email', 'is_patient', 'is_doctor', 'is_staff', 'date_joined']
+    list_filter = ['is_patient', 'is_doctor', 'is_staff']
+    search_fields = ['^username']
+
+
+@admin.register(Doctor)
+class DoctorAdmin(ProfileAdmin):
+    list_display = ['user', 'speciality', 'hospital', 'start_date']
+    list_filter = ['speciality', 'hospital']
+    autocomplete_fields = ['patients']
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name == 'patients':
+            # The widget renders the already selected patients through this queryset.
+            kwargs['queryset'] = Patient.objects.select_related('user')
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
+
+@admin.register(Patient)
+class PatientAdmin(ProfileAdmin):
+    list_display = ['user', 'sex', 'age_category', 'heart_disease_risk', 'risk_model_version', 'risk_scored_at']
+    list_filter = ['heart_disease', 'risk_scored_at']
+    raw_id_fields = ['user', 'emergency_contact']
+    actions = ['rescore_all_patients']
+    # Actions that cover the whole table, so the changelist runs them without any rows ticked.
+    selectionless_actions = ['rescore_all_patients']
+
+    def changelist_view(self, request, extra_context=None):
+        action = request.POST.get('action')
+        if action in self.selectionless_actions and not request.POST.getlist(helpers.ACTION_CHECKBOX_NAME):
+            # Only offered to users with the action's permissions; anyone else gets the usual changelist.
+            actions = self.get_actions(request)
+            if action in actions:
+                func, _, _ = actions[action]
+                func(self, request, self.get_queryset(request))
+                return HttpResponseRedirect(request.get_full_path())
+        return super().changelist_view(request, extra_context)
+
+    @admin.action(description="Re-score all patients with the deployed model (runs in the background)",
+                  permissions=['change'])
+    def rescore_all_patients(self, request, queryset):
+        # Always the whole table: the job walks every patient in primary-key order.
+        try:
+            job = rescoring.start_job()
+        except Exception as e:
+            self.message_user(request, f"Could not load the deployed model: {e}", messages.ERROR)
+            return
+        rescoring.run_job_in_background(job, claimed=True)
+        self.message_user(request, f"Started {job}.", messages.SUCCESS)
+
+
+@admin.register(RescoreJob)
+class RescoreJobAdmin(admin.ModelAdmin):
+    list_display = ['pk', 'model_version', 'status', 'processed', 'skipped', 'rows_per_sec', 'last_pk', 'started_at',
+                    'updated_at']
+    readonly_fields = ['model_version', 'status', 'last_pk', 'processed', 'skipped', 'rows_per_sec', 'started_at',
+                       'updated_at', 'finished_at', 'error']
+    actions = ['resume_jobs']
+
+    @admin.action(description="Resume selected jobs (runs in the background)")
+    def resume_jobs(self, request, queryset):
+        for job in queryset:
+            if rescoring.run_job_in_background(job):
+                self.message_user(request, f"Resumed {job}.", messages.SUCCESS)
+            else:
+                self.message_user(request, f"{job} is done or still running elsewhere.", messages.WARNING)
@@ -0,0 +1,218 @@
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .features import map_age_category
+from .models import CohortStats, Doctor, DoctorStats, Patient
+
+COHORT_FIELDS = ('age_category', 'sex', 'diabetes', 'depression', 'heart_disease', 'general_health', 'bmi')
+
+GENERAL_HEALTH_COLUMNS = {
+    'Poor': 'general_health_poor',
+    'Fair': 'general_health_fair',
+    'Good': 'general_health_good',
+    'Very Good': 'general_health_very_good',
+    'Excellent': 'general_health_excellent',
+}
+
+SEX_LABELS = {'Kadın': 'female', 'Erkek': 'male'}
+
+UNKNOWN_AGE_GROUP = -1
+
+
+def age_group(age_category):
+    try:
+        return map_age_category(age_category)
+    except (TypeError, ValueError):
+        return UNKNOWN_AGE_GROUP
+
+
+def age_group_label(group):
+    if group == UNKNOWN_AGE_GROUP:
+        return 'unknown'
+    if group == 0:
+        return '18-24'
+    if group == 12:
+        return '80+'
+    return f'{(group + 4) * 5}-{(group + 4) * 5 + 4}'
+
+
+def _clean(values):
+    return {field: Patient._meta.get_field(field).to_python(values[field]) for field in COHORT_FIELDS}
+
+
+def _snapshot(patient):
+    if patient.get_deferred_fields().intersection(COHORT_FIELDS):
+        return None
+    return _clean(patient.__dict__)
+
+
+def _cohort_key(values):
+    return age_group(values['age_category']), SEX_LABELS.get(values['sex'], 'unknown')
+
+
+def _cohort_counts(values, sign):
+    counts = Counter({
+        'patients': sign,
+        'diabetes': sign * bool(values['diabetes']),
+        'depression': sign * bool(values['depression']),
+        'heart_disease': sign * bool(values['heart_disease']),
+        GENERAL_HEALTH_COLUMNS.get(values['general_health'], 'general_health_unknown'): sign,
+    })
+    counts['bmi_sum'] = sign * float(values['bmi'] or 0)
+    return counts
+
+
+def _apply_cohort(key, counts):
+    counts = {field: value for field, value in counts.items() if value}
+    if not counts:
+        return
+    now = timezone.now()
+    rows = CohortStats.objects.filter(age_group=key[0], sex=key[1])
+    increments = {field: F(field) + value for field, value in counts.items()}
+    if rows.update(updated_at=now, **increments):
+        return
+    if not CohortStats.objects.exists():
+        # First change since the table was created: build it from scratch, which already includes this change.
+        rebuild()
+        return
+    try:
+        with transaction.atomic():
+            CohortStats.objects.create(age_group=key[0], sex=key[1], updated_at=now, **counts)
+    except IntegrityError:
+        rows.update(updated_at=now, **increments)
+
+
+def _apply_doctor_stats(doctor_pks, patients_delta, bmi_delta, create_missing=True):
+    doctor_pks = set(doctor_pks)
+    if not doctor_pks or not (patients_delta or bmi_delta):
+        return
+    now = timezone.now()
+    updated = DoctorStats.objects.filter(doctor_id__in=doctor_pks).update(
+        patients=F('patients') + patients_delta, bmi_sum=F('bmi_sum') + bmi_delta, updated_at=now)
+    if create_missing and updated < len(doctor_pks):
+        # Doctors without a stats row yet are counted from the link table, which already reflects this change.
+        missing = doctor_pks - set(DoctorStats.objects.filter(doctor_id__in=doctor_pks).values_list('pk', flat=True))
+        DoctorStats.objects.bulk_create(_doctor_stats(Doctor.objects.filter(pk__in=missing), now),
+                                        ignore_conflicts=True)
+
+
+def _doctor_stats(doctors, now):
+    rows = doctors.annotate(
+        num_patients=Count('patients'),
+        patients_bmi=Coalesce(Sum('patients__bmi'), Value(0.0), output_field=FloatField()),
+    ).values_list('pk', 'num_patients', 'patients_bmi')
+    return [DoctorStats(doctor_id=pk, patients=num_patients, bmi_sum=patients_bmi, updated_at=now)
+            for pk, num_patients, patients_bmi in rows]
+
+
+def rebuild():
+    """Recompute every summary row from the source tables, e.g. after bulk loads that bypass signals."""
+    now = timezone.now()
+    cohorts = defaultdict(Counter)
+    for values in Patient.objects.values(*COHORT_FIELDS).iterator(chunk_size=2000):
+        values = _clean(values)
+        cohorts[_cohort_key(values)].update(_cohort_counts(values, 1))
+
+    with transaction.atomic():
+        CohortStats.objects.all().delete()
+        CohortStats.objects.bulk_create([
+            CohortStats(age_group=key[0], sex=key[1], updated_at=now, **counts) for key, counts in cohorts.items()
+        ])
+        DoctorStats.objects.all().delete()
+        DoctorStats.objects.bulk_create(_doctor_stats(Doctor.objects.all(), now))
+
+
+@receiver(post_init, sender=Patient)
+def remember_cohort_values(sender, instance, **kwargs):
+    instance._analytics_snapshot = _snapshot(instance)
+
+
+def _stored_values(instance):
+    """Cohort values the summaries currently count for ``instance``, read from the table if they were deferred."""
+    if instance._analytics_snapshot is None:
+        previous = Patient.objects.filter(pk=instance.pk).values(*COHORT_FIELDS).first()
+        instance._analytics_snapshot = _clean(previous) if previous else None
+    return instance._analytics_snapshot
+
+
+@receiver(pre_save, sender=Patient)
+def load_cohort_values(sender, instance, **kwargs):
+    if not instance._state.adding:
+        _stored_values(instance)
+
+
+@receiver(post_save, sender=Patient)
+def update_patient_aggregates(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields).intersection(COHORT_FIELDS):
+        return
+    old = None if created else instance._analytics_snapshot
+    # A deferred instance only saved the fields it loaded; the others keep their stored values.
+    new = _clean({**(old or {}), **instance.__dict__})
+    instance._analytics_snapshot = new
+    if old == new:
+        return
+
+    if old is None:
+        _apply_cohort(_cohort_key(new), _cohort_counts(new, 1))
+        return
+
+    if _cohort_key(old) == _cohort_key(new):
+        counts = _cohort_counts(new, 1)
+        counts.subtract(_cohort_counts(old, 1))
+        _apply_cohort(_cohort_key(new), counts)
+    else:
+        _apply_cohort(_cohort_key(old), _cohort_counts(old, -1))
+        _apply_cohort(_cohort_key(new), _cohort_counts(new, 1))
+
+    bmi_delta = float(new['bmi'] or 0) - float(old['bmi'] or 0)
+    if bmi_delta:
+        _apply_doctor_stats(instance.doctors.values_list('pk', flat=True), 0, bmi_delta)
+
+
+@receiver(pre_delete, sender=Patient)
+def unlink_deleted_patient(sender, instance, **kwargs):
+    values = _stored_values(instance)
+    if values is None:
+        return
+    _apply_doctor_stats(instance.doctors.values_list('pk', flat=True), -1, -float(values['bmi'] or 0),
+                        create_missing=False)
+
+
+@receiver(post_delete, sender=Patient)
+def remove_deleted_patient(sender, instance, **kwargs):
+    # Loaded by unlink_deleted_patient() while the row still existed.
+    values = instance._analytics_snapshot
+    if values is None:
+        return
+    _apply_cohort(_cohort_key(values), _cohort_counts(values, -1))
+
+
+@receiver(post_save, sender=Doctor)
+def create_doctor_stats(sender, instance, created, **kwargs):
+    if created:
+        DoctorStats.objects.get_or_create(doctor=instance)
+
+
+@receiver(m2m_changed, sender=Doctor.patients.through)
+def update_doctor_aggregates(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        related = instance.doctors if reverse else instance.patients
+        instance._analytics_cleared = set(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        action, pk_set = 'post_remove', instance.__dict__.pop('_analytics_cleared', set())
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+
+    sign = 1 if action == 'post_add' else -1
+    if reverse:
+        _apply_doctor_stats(pk_set, sign, sign * float(instance.bmi or 0))
+    else:
+        bmi = Patient.objects.filter(pk__in=pk_set).aggregate(total=Sum('bmi'))['total'] or 0
+        _apply_doctor_stats([instance.pk], sign * len(pk_set), sign * bmi)
@@ -0,0 +1,50 @@
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.pagination import CursorPagination
+
+from users import metrics
+from users.models import Doctor
+
+FACET_FIELDS = ['speciality', 'hospital']
+FACETS_KEY = 'directory:facets'
+# Bulk loads bypass the signals below, so the summary also expires on its own.
+FACETS_TIMEOUT = 10 * 60
+
+
+class DirectoryPagination(CursorPagination):
+    """Keyset pages ordered by username: each page is one index range scan, however deep the client goes."""
+    ordering = 'username'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def _counts(field):
+    rows = (Doctor.objects.exclude(**{f'{field}__isnull': True}).values(field)
+            .annotate(doctors=Count('pk')).order_by('-doctors', field))
+    return [{'value': row[field], 'doctors': row['doctors']} for row in rows]
+
+
+def facets():
+    """Number of doctors per speciality and per hospital, largest first, from the default cache when possible."""
+    summary = cache.get(FACETS_KEY)
+    if summary is not None:
+        metrics.incr('directory.facets_hit')
+        return summary
+
+    metrics.incr('directory.facets_miss')
+    summary = {field: _counts(field) for field in FACET_FIELDS}
+    cache.set(FACETS_KEY, summary, FACETS_TIMEOUT)
+    return summary
+
+
+def invalidate_facets():
+    cache.delete(FACETS_KEY)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_facets(sender, instance, **kwargs):
+    invalidate_facets()
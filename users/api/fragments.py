@@ -0,0 +1,165 @@
+import random
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from users.models import User, Patient, Doctor
+from .serializers import PatientSerializer, DoctorSerializer
+
+# Bump when PatientSerializer or DoctorSerializer output changes so old fragments are never served.
+FRAGMENT_VERSION = 1
+
+CACHE_ALIAS = 'fragments'
+
+# Misses are always loaded from the primary: a fragment read from a lagging replica would be shared with
+# every user until it expires.
+KINDS = {
+    'patient': (PatientSerializer,
+                lambda pks: Patient.objects.using('default').filter(pk__in=pks).select_related('user')),
+    # Doctor payloads only list patient pks, so prefetch nothing else.
+    'doctor': (DoctorSerializer, lambda pks: Doctor.objects.using('default').filter(pk__in=pks).select_related('user')
+               .prefetch_related(Prefetch('patients', queryset=Patient.objects.using('default').only('pk')))),
+}
+
+
+def _version_key(kind, pk):
+    return f'{kind}:version:{pk}'
+
+
+def _key(kind, pk, version):
+    return f'{kind}:{FRAGMENT_VERSION}:{pk}:{version}'
+
+
+def _new_version():
+    # Random rather than counted, so a version key lost to eviction never matches fragments written before.
+    return random.getrandbits(48)
+
+
+def _versions(cache, kind, pks):
+    """
+    Current version of every object in ``pks``, starting a version for objects that have none. A fragment is
+    only stored under a version read before its object was loaded, so an invalidation that lands in between
+    leaves it under a version nobody asks for any more.
+    """
+    keys = {pk: _version_key(kind, pk) for pk in pks}
+    found = cache.get_many(keys.values())
+    fresh = {key: _new_version() for key in keys.values() if key not in found}
+    if fresh:
+        cache.set_many(fresh, None)
+        found.update(fresh)
+    return {pk: found[key] for pk, key in keys.items()}
+
+
+def get_many(kind, pks):
+    """
+    Serialized fragments for ``pks``, in order, from two cache multi-gets (versions, then fragments). Misses
+    are loaded in one query, serialized and written back with one multi-set. Primary keys that no longer
+    exist are left out.
+    """
+    cache = caches[CACHE_ALIAS]
+    pks = list(pks)
+    versions = _versions(cache, kind, pks)
+    keys = [_key(kind, pk, versions[pk]) for pk in pks]
+    found = cache.get_many(keys)
+
+    missing = [pk for pk, key in zip(pks, keys) if key not in found]
+    if missing:
+        serializer_class, load = KINDS[kind]
+        objs = list(load(missing))
+        # One ListSerializer builds its fields once instead of once per object.
+        fresh = {_key(kind, obj.pk, versions[obj.pk]): data
+                 for obj, data in zip(objs, serializer_class(objs, many=True).data)}
+        cache.set_many(fresh)
+        found.update(fresh)
+
+    return [found[key] for key in keys if key in found]
+
+
+def put(kind, obj):
+    """Serialize ``obj``, store its fragment and return it, e.g. right after an update."""
+    cache = caches[CACHE_ALIAS]
+    version = _versions(cache, kind, [obj.pk])[obj.pk]
+    serializer_class, _ = KINDS[kind]
+    data = serializer_class(obj).data
+    cache.set(_key(kind, obj.pk, version), data)
+    return data
+
+
+def invalidate(kind, pks):
+    """
+    Move every object in ``pks`` to a new version; fragments stored under the old one are never read again.
+    Inside a transaction the move waits for the commit: until then other connections still read the old rows,
+    and a miss loaded in between would store them under the new version.
+    """
+    keys = [_version_key(kind, pk) for pk in pks]
+    if keys:
+        transaction.on_commit(lambda: caches[CACHE_ALIAS].set_many({key: _new_version() for key in keys}, None),
+                              using='default')
+
+
+class FragmentListMixin:
+    """List views answer from cached fragments: one pk query, one multi-get, and queries only for misses."""
+    fragment_kind = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(get_many(self.fragment_kind, queryset.values_list('pk', flat=True)))
+
+
+class FragmentRetrieveMixin:
+    fragment_kind = None
+
+    def retrieve(self, request, *args, **kwargs):
+        found = get_many(self.fragment_kind, [self.get_object_pk()])
+        if not found:
+            raise NotFound()
+        return Response(found[0])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate('patient', [instance.pk])
+    invalidate('doctor', [instance.pk])
+
+
+@receiver(post_save, sender=Patient)
+def invalidate_patient(sender, instance, **kwargs):
+    invalidate('patient', [instance.pk])
+
+
+@receiver(pre_delete, sender=Patient)
+def remember_patient_doctors(sender, instance, **kwargs):
+    instance._fragment_doctors = list(instance.doctors.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Patient)
+def invalidate_deleted_patient(sender, instance, **kwargs):
+    # Deleting a patient also drops it from its doctors' patient lists.
+    invalidate('patient', [instance.pk])
+    invalidate('doctor', instance.__dict__.pop('_fragment_doctors', []))
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor(sender, instance, **kwargs):
+    invalidate('doctor', [instance.pk])
+
+
+@receiver(m2m_changed, sender=Doctor.patients.through)
+def invalidate_doctor_patients(sender, instance, action, reverse, pk_set, **kwargs):
+    # Doctor fragments embed the patient list and count; patient fragments do not embed doctors.
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate('doctor', [instance.pk])
+    elif action == 'pre_clear':
+        instance._fragment_doctors = list(instance.doctors.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        invalidate('doctor', instance.__dict__.pop('_fragment_doctors', []))
+    elif action in ('post_add', 'post_remove'):
+        invalidate('doctor', pk_set)
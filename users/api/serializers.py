@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from users.models import User, Patient, Doctor, EmergencyContact
+from users.models import User, Patient, Doctor, EmergencyContact, VitalsRollup
+from users.vitals import VITALS_FIELDS
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -22,13 +23,18 @@ class DoctorSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_num_patients(self, obj):
+        # Answered from the prefetched patients when the queryset has them.
         return obj.patients.count()
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        ret['num_patients'] = self.get_num_patients(instance)
-        print(ret['num_patients'])
-        return ret
+
+class DoctorDirectorySerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username')
+    first_name = serializers.CharField(source='user.first_name')
+    last_name = serializers.CharField(source='user.last_name')
+
+    class Meta:
+        model = Doctor
+        fields = ['username', 'first_name', 'last_name', 'speciality', 'hospital', 'start_date']
 
 
 class PatientSerializer(serializers.ModelSerializer):
@@ -37,6 +43,11 @@ class PatientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
         fields = '__all__'
+        # Centimetres and kilograms; vitals snapshots store both as small positive integers.
+        extra_kwargs = {
+            'height': {'min_value': 1, 'max_value': 300},
+            'weight': {'min_value': 1, 'max_value': 700},
+        }
 
 
 class BaseSignUpSerializer(serializers.ModelSerializer):
@@ -107,3 +118,15 @@ class EmergencyContactSerializer(serializers.ModelSerializer):
         instance.relationship = validated_data.get('relationship', instance.relationship)
         instance.save()
         return instance
+
+
+class VitalsTrendSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VitalsRollup
+        fields = ['bucket', 'count', 'weight_min', 'weight_max', 'bmi_min', 'bmi_max']
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        for field in VITALS_FIELDS:
+            ret[f'{field}_avg'] = round(getattr(instance, f'{field}_sum') / instance.count, 2)
+        return ret
@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from users import metrics
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Allows ``num_requests`` per ``duration`` for ``view.throttle_scope``.
+
+    Requests are counted per fixed window with atomic cache increments, so concurrent requests can never read
+    the same count. The previous window's count is weighted by how much of it still overlaps the trailing
+    ``duration``, which smooths out the double burst a plain fixed window allows at each boundary. Counters
+    live in the default cache, so every worker shares them when that cache is a shared backend.
+    """
+    cache = default_cache
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+    scope_suffix = None
+
+    def __init__(self):
+        # Defer rate lookup until the view's scope is known, like ScopedRateThrottle.
+        self.wait_time = None
+        self.counted_key = None
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        base_scope = getattr(view, 'throttle_scope', None)
+        if not base_scope:
+            return True
+
+        self.scope = f'{base_scope}_{self.scope_suffix}'
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        position = self.timer() / self.duration
+        window = int(position)
+        elapsed = position - window
+        key = f'{self.key}_{window}'
+        self.cache.add(key, 0, self.duration * 2)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.set(key, 1, self.duration * 2)
+            count = 1
+        previous = self.cache.get(f'{self.key}_{window - 1}', 0)
+
+        if previous * (1 - elapsed) + count > self.num_requests:
+            self._decr(key)
+            self.wait_time = self._wait(previous, count, elapsed)
+            metrics.incr(f'throttle.{self.scope}.rejected')
+            return False
+        self.counted_key = key
+        return True
+
+    def refund(self):
+        """Uncount an allowed request, e.g. because another throttle rejected it."""
+        if self.counted_key:
+            self._decr(self.counted_key)
+            self.counted_key = None
+
+    def _decr(self, key):
+        try:
+            self.cache.decr(key)
+        except ValueError:
+            pass
+
+    def _wait(self, previous, count, elapsed):
+        """Seconds until the weighted count leaves room for this request again."""
+        if count <= self.num_requests:
+            # Only the previous window's share is in the way; it shrinks as the window advances.
+            return max(0.0, 1 - (self.num_requests - count) / previous - elapsed) * self.duration
+        # This window is full: wait for its ``count - 1`` allowed requests to become the previous window and
+        # shrink enough.
+        return (1 - elapsed + 1 - (self.num_requests - 1) / (count - 1)) * self.duration
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserRateThrottle(SlidingWindowThrottle):
+    scope_suffix = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class GlobalRateThrottle(SlidingWindowThrottle):
+    scope_suffix = 'global'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': 'all'}
+
+
+class ScopedThrottleMixin:
+    """
+    Per-user and global rate limits for ``throttle_scope``. Unlike APIView.check_throttles(), a request one
+    limit rejects is refunded to the limits that had already counted it, so a full global limit does not also
+    use up the user's allowance.
+    """
+    throttle_classes = [UserRateThrottle, GlobalRateThrottle]
+
+    def check_throttles(self, request):
+        counted = []
+        for throttle in self.get_throttles():
+            if not throttle.allow_request(request, self):
+                for other in counted:
+                    other.refund()
+                self.throttled(request, throttle.wait())
+            counted.append(throttle)
+
+
+class InFlightLimitMixin:
+    """
+    Caps concurrent requests per ``throttle_scope`` with a counting semaphore in the default cache.
+
+    The slot is taken after authentication, permissions and throttles, so rejected requests never reach the
+    handler, and is released when dispatch() returns or raises.
+    """
+    in_flight_timeout = 300
+
+    def dispatch(self, request, *args, **kwargs):
+        self._in_flight_key = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Unhandled exceptions skip finalize_response(), so release here.
+            if self._in_flight_key:
+                self._release(self._in_flight_key)
+                self._in_flight_key = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        limit = settings.MAX_IN_FLIGHT.get(self.throttle_scope)
+        if not limit:
+            return
+
+        key = f'in_flight_{self.throttle_scope}'
+        default_cache.add(key, 0, self.in_flight_timeout)
+        try:
+            in_flight = default_cache.incr(key)
+        except ValueError:
+            default_cache.set(key, 1, self.in_flight_timeout)
+            in_flight = 1
+        # incr() keeps the original expiry; re-arm it so the counter cannot expire under in-flight requests.
+        default_cache.touch(key, self.in_flight_timeout)
+
+        if in_flight > limit:
+            self._release(key)
+            metrics.incr(f'in_flight.{self.throttle_scope}.rejected')
+            raise Throttled(detail="Too many concurrent requests, please retry shortly.")
+        self._in_flight_key = key
+
+    # noinspection PyMethodMayBeStatic
+    def _release(self, key):
+        try:
+            in_flight = default_cache.decr(key)
+        except ValueError:
+            return
+        if in_flight < 0:
+            # The counter expired and restarted while this request was in flight.
+            default_cache.incr(key, -in_flight)
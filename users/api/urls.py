@@ -2,7 +2,8 @@ from django.urls import path
 from .views import (DoctorSignUpView, PatientSignUpView, CustomAuthToken, LogoutView, DoctorOnlyView, PatientOnlyView,
                     AddDoctorToPatientView, AddPatientToDoctorView, ListDoctorsOfPatientView, ListPatientsOfDoctorView,
                     ListAllPatientsView, UpdateDoctorDataView, UpdatePatientDataView, IsPatientView,
-                    PredictHeartDiseaseView, ChatbotResponseView)
+                    PredictHeartDiseaseView, ChatbotResponseView, MetricsView, PatientVitalsTrendView,
+                    PopulationAnalyticsView, ExplainHeartDiseaseView, DoctorDirectoryView)
 
 urlpatterns = [
     path('signup/doctor', DoctorSignUpView.as_view(), name='doctor_signup'),
@@ -15,10 +16,15 @@ urlpatterns = [
     path('doctor/add-patient/', AddPatientToDoctorView.as_view(), name='add_patient_to_doctor'),
     path('patient/list-doctors/', ListDoctorsOfPatientView.as_view(), name='list_doctors_of_patient'),
     path('doctor/list-patients/', ListPatientsOfDoctorView.as_view(), name='list_patients_of_doctor'),
+    path('doctors/', DoctorDirectoryView.as_view(), name='doctor_directory'),
     path('doctor/list-all-patients/', ListAllPatientsView.as_view(), name='list_all_patients'),
     path('doctor/update', UpdateDoctorDataView.as_view(), name='update_doctor'),
     path('patient/update', UpdatePatientDataView.as_view(), name='update_patient'),
+    path('vitals/trend/', PatientVitalsTrendView.as_view(), name='vitals_trend'),
+    path('analytics/population/', PopulationAnalyticsView.as_view(), name='population_analytics'),
     path('is-patient/', IsPatientView.as_view(), name='is_patient'),
     path('predict-heart-disease/', PredictHeartDiseaseView.as_view(), name='predict_heart_disease'),
+    path('explain-heart-disease/', ExplainHeartDiseaseView.as_view(), name='explain_heart_disease'),
     path('chatbot/', ChatbotResponseView.as_view(), name='chatbot'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,46 +1,38 @@
 import re
-
-import joblib
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import pandas as pd
 from rest_framework import generics, status
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.db_router import ReadReplicaMixin, pool_stats
 from .permissions import IsDoctorUser, IsPatientUser
 from .serializers import (UserSerializer, DoctorSerializer, PatientSerializer, DoctorSignUpSerializer,
-                          PatientSignUpSerializer)
-from ..models import Doctor, Patient
+                          PatientSignUpSerializer, VitalsTrendSerializer, DoctorDirectorySerializer)
+from . import directory, fragments
+from .fragments import FragmentListMixin, FragmentRetrieveMixin
+from .throttling import ScopedThrottleMixin, InFlightLimitMixin
+from ..models import Doctor, Patient, VitalsRollup, CohortStats, DoctorStats
+from .. import analytics, chat, explain, metrics, rescoring, resilience, shadow
+from ..features import build_features, load_model
+from ..translation import EN, TR, translate_text
+from ..vitals import VITALS_FIELDS, PERIODS, record_vitals
 import google.generativeai as genai
-from google.cloud import translate
 
 chat_model = genai.GenerativeModel(f'tunedModels/generate-num-7619')
 
-EN = "en-US"
-TR = "tr"
-PROJECT_ID = "valid-flow-412916"
-
-
-def translate_text(text="Hello, world!", source_language="en-US", target_language="tr"):
-    client = translate.TranslationServiceClient()
-    location = "global"
-    parent = f"projects/{PROJECT_ID}/locations/{location}"
-
-    response = client.translate_text(
-        request={
-            "parent": parent,
-            "contents": [text],
-            "mime_type": "text/plain",
-            "source_language_code": source_language,
-            "target_language_code": target_language,
-        }
-    )
-    for translation in response.translations:
-        return translation.translated_text
-
 
 class DoctorSignUpView(generics.CreateAPIView):
     serializer_class = DoctorSignUpSerializer
@@ -93,21 +85,29 @@ class LogoutView(APIView):
         return Response(status=status.HTTP_200_OK)
 
 
-class PatientOnlyView(generics.RetrieveAPIView):
+class PatientOnlyView(ReadReplicaMixin, FragmentRetrieveMixin, generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated & IsPatientUser]
     serializer_class = PatientSerializer
+    fragment_kind = 'patient'
 
     def get_object(self):
         return self.request.user.patient
 
+    def get_object_pk(self):
+        return self.request.user.pk
+
 
-class DoctorOnlyView(generics.RetrieveAPIView):
+class DoctorOnlyView(ReadReplicaMixin, FragmentRetrieveMixin, generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated & IsDoctorUser]
     serializer_class = DoctorSerializer
+    fragment_kind = 'doctor'
 
     def get_object(self):
         return self.request.user.doctor
 
+    def get_object_pk(self):
+        return self.request.user.pk
+
 
 class AddDoctorToPatientView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated & IsPatientUser]
@@ -120,10 +120,9 @@ class AddDoctorToPatientView(generics.UpdateAPIView):
         patient = self.get_object()
         doctor_username = request.data.get('doctor_username')
 
-        doctor = get_object_or_404(Doctor, user__username=doctor_username)
+        doctor = get_object_or_404(Doctor.objects.select_related('user'), user__username=doctor_username)
 
         patient.doctors.add(doctor)
-        doctor.patients.add(patient)
 
         return Response({
             "message": f"Doctor '{doctor.user.username}' added to patient '{patient.user.username}' successfully.",
@@ -143,10 +142,9 @@ class AddPatientToDoctorView(generics.UpdateAPIView):
         doctor = self.get_object()
         patient_username = request.data.get('patient_username')
 
-        patient = get_object_or_404(Patient, user__username=patient_username)
+        patient = get_object_or_404(Patient.objects.select_related('user'), user__username=patient_username)
 
         doctor.patients.add(patient)
-        patient.doctors.add(doctor)
 
         return Response({
             "message": f"Patient '{patient.user.username}' added to doctor '{doctor.user.username}' successfully.",
@@ -155,41 +153,91 @@ class AddPatientToDoctorView(generics.UpdateAPIView):
         }, status=status.HTTP_200_OK)
 
 
-class ListDoctorsOfPatientView(generics.ListAPIView):
+class ListDoctorsOfPatientView(ReadReplicaMixin, FragmentListMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated & IsPatientUser]
     serializer_class = DoctorSerializer
+    fragment_kind = 'doctor'
 
     def get_queryset(self):
-        return self.request.user.patient.doctors.all()
+        return Doctor.objects.filter(patients=self.request.user.pk)
 
 
-class ListAllPatientsView(generics.ListAPIView):
+class ListAllPatientsView(ReadReplicaMixin, FragmentListMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated & IsDoctorUser]
     serializer_class = PatientSerializer
+    fragment_kind = 'patient'
 
     def get_queryset(self):
         return PatientSerializer.Meta.model.objects.all()
 
 
-class ListPatientsOfDoctorView(generics.ListAPIView):
+class ListPatientsOfDoctorView(ReadReplicaMixin, FragmentListMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated & IsDoctorUser]
     serializer_class = PatientSerializer
+    fragment_kind = 'patient'
+
+    def get_queryset(self):
+        return Patient.objects.filter(doctors=self.request.user.pk)
+
+
+class DoctorDirectoryView(ReadReplicaMixin, generics.ListAPIView):
+    """
+    Doctors filtered by ``speciality``, ``hospital``, ``min_years`` and ``max_years`` of experience and a
+    username prefix ``q``, a cursor-paginated page at a time, with the doctor counts per speciality and hospital.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = DoctorDirectorySerializer
+    pagination_class = directory.DirectoryPagination
 
     def get_queryset(self):
-        return self.request.user.doctor.patients.all()
+        params = self.request.query_params
+        queryset = (Doctor.objects.select_related('user').annotate(username=F('user__username'))
+                    .only('speciality', 'hospital', 'start_date', 'user__username', 'user__first_name',
+                          'user__last_name'))
+        for param in ('speciality', 'hospital'):
+            if params.get(param):
+                queryset = queryset.filter(**{param: params[param]})
+        if params.get('q'):
+            # Served by the UPPER(username) pattern index.
+            queryset = queryset.filter(user__username__istartswith=params['q'])
+        for param, lookup in (('min_years', 'start_date__lte'), ('max_years', 'start_date__gte')):
+            if params.get(param):
+                queryset = queryset.filter(**{lookup: self.years_ago(param, params[param])})
+        return queryset
+
+    @staticmethod
+    def years_ago(param, value):
+        try:
+            years = int(value)
+        except ValueError:
+            years = -1
+        if not 0 <= years <= 100:
+            raise ValidationError({param: "Must be a whole number of years between 0 and 100."})
+        today = date.today()
+        # 29 February falls back to the 28th in years without one.
+        return today.replace(year=today.year - years, day=min(today.day, 28) if today.month == 2 else today.day)
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.data['facets'] = directory.facets()
+        return response
 
 
 class UpdateUserDataView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated]
+    # Fields the server computes, ignored even when present in the request.
+    read_only_fields = []
 
     def get_object(self):
         raise NotImplementedError("Subclasses must implement this method.")
 
     def update(self, request, *args, **kwargs):
         user_data = self.get_object()
+        # Rejects values the models cannot store before anything is written.
+        self.get_serializer(user_data, data=request.data, partial=True).is_valid(raise_exception=True)
         common_fields = ['first_name', 'last_name', 'birth_date', 'gender']
         sub_fields = [field.name for field in user_data._meta.get_fields()]
-        fields_to_update = common_fields + sub_fields
+        fields_to_update = [field for field in common_fields + sub_fields if field not in self.read_only_fields]
 
         for field in fields_to_update:
             if field in request.data:
@@ -198,11 +246,14 @@ class UpdateUserDataView(generics.UpdateAPIView):
                 else:
                     setattr(user_data, field, request.data[field])
 
+        with transaction.atomic():
+            self.perform_save(user_data)
+        return self.get_response(user_data)
+
+    def perform_save(self, user_data):
         user_data.user.save()
         user_data.save()
 
-        return self.get_response(user_data)
-
     def get_response(self, user_data):
         raise NotImplementedError("Subclasses must implement this method.")
 
@@ -218,22 +269,99 @@ class UpdateDoctorDataView(UpdateUserDataView):
         return Response({
             "message": f"Doctor '{doctor}' updated successfully.",
             "doctor_id": doctor.pk,
-            "details": DoctorSerializer(doctor).data,
+            "details": fragments.put('doctor', doctor),
         }, status=status.HTTP_200_OK)
 
 
 class UpdatePatientDataView(UpdateUserDataView):
     permission_classes = [IsAuthenticated & IsPatientUser]
     serializer_class = PatientSerializer
+    read_only_fields = rescoring.RISK_FIELDS
 
     def get_object(self):
         return self.request.user.patient
 
+    def perform_save(self, patient):
+        super().perform_save(patient)
+        # In the same transaction, so a snapshot that cannot be recorded also undoes the update.
+        if any(field in self.request.data for field in VITALS_FIELDS):
+            record_vitals(patient)
+
     def get_response(self, patient):
         return Response({
             "message": f"Patient '{patient}' updated successfully.",
             "patient_id": patient.pk,
-            "details": PatientSerializer(patient).data,
+            "details": fragments.put('patient', patient),
+        }, status=status.HTTP_200_OK)
+
+
+class PatientSubjectMixin:
+    """Patients see their own data; doctors pick one of their patients with ``?patient_username=``."""
+    permission_classes = [IsAuthenticated & (IsPatientUser | IsDoctorUser)]
+
+    def get_patient(self):
+        if self.request.user.is_patient:
+            return self.request.user.patient
+        patient_username = self.request.query_params.get('patient_username')
+        return get_object_or_404(self.request.user.doctor.patients, user__username=patient_username)
+
+
+class PatientVitalsTrendView(ReadReplicaMixin, PatientSubjectMixin, generics.ListAPIView):
+    serializer_class = VitalsTrendSerializer
+    max_buckets = 1000
+
+    def get_queryset(self):
+        params = self.request.query_params
+        period = PERIODS.get(params.get('period', 'day'))
+        if period is None:
+            raise ValidationError({'period': f"Must be one of {', '.join(PERIODS)}."})
+
+        queryset = VitalsRollup.objects.filter(patient=self.get_patient(), period=period)
+        for param, lookup in (('since', 'bucket__gte'), ('until', 'bucket__lte')):
+            if params.get(param):
+                moment = parse_datetime(params[param])
+                if moment is None:
+                    raise ValidationError({param: "Must be an ISO 8601 datetime."})
+                queryset = queryset.filter(**{lookup: moment})
+        return queryset.order_by('bucket')[:self.max_buckets]
+
+
+class PopulationAnalyticsView(ReadReplicaMixin, APIView):
+    permission_classes = [IsAuthenticated & (IsDoctorUser | IsAdminUser)]
+
+    def get(self, request):
+        cohorts = list(CohortStats.objects.order_by('age_group', 'sex'))
+        doctors = list(DoctorStats.objects.select_related('doctor__user').order_by('doctor__user__username'))
+
+        general_health = {label: 0 for label in analytics.GENERAL_HEALTH_COLUMNS}
+        general_health['Unknown'] = 0
+        prevalence = []
+        for cohort in cohorts:
+            for label, column in analytics.GENERAL_HEALTH_COLUMNS.items():
+                general_health[label] += getattr(cohort, column)
+            general_health['Unknown'] += cohort.general_health_unknown
+            if cohort.patients:
+                prevalence.append({
+                    "age_category": analytics.age_group_label(cohort.age_group),
+                    "sex": cohort.sex,
+                    "patients": cohort.patients,
+                    "diabetes": round(cohort.diabetes / cohort.patients, 4),
+                    "depression": round(cohort.depression / cohort.patients, 4),
+                    "heart_disease": round(cohort.heart_disease / cohort.patients, 4),
+                })
+
+        as_of = max([row.updated_at for row in cohorts + doctors], default=None)
+        return Response({
+            "as_of": as_of,
+            "seconds_since_update": round((timezone.now() - as_of).total_seconds(), 3) if as_of else None,
+            "patients": sum(cohort.patients for cohort in cohorts),
+            "general_health": general_health,
+            "prevalence": prevalence,
+            "average_bmi_per_doctor": [{
+                "doctor": stats.doctor.user.username,
+                "patients": stats.patients,
+                "average_bmi": round(stats.bmi_sum / stats.patients, 2) if stats.patients else None,
+            } for stats in doctors],
         }, status=status.HTTP_200_OK)
 
 
@@ -246,103 +374,86 @@ class IsPatientView(APIView):
         })
 
 
-class PredictHeartDiseaseView(APIView):
+class PredictHeartDiseaseView(ScopedThrottleMixin, InFlightLimitMixin, APIView):
     permission_classes = [IsAuthenticated & IsPatientUser]
+    throttle_scope = 'predict'
 
     def get(self, request):
         patient = self.request.user.patient
-        data = {}
-        general_health_mapping = {
-            'Poor': 0,
-            'Fair': 1,
-            'Good': 2,
-            'Very Good': 3,
-            'Excellent': 4
-        }
-
-        checkup_mapping = {'Within the past year': 4, 'Within the past 2 years': 2, 'Within the past 5 years': 1,
-                           '5 or more years ago': 0.2, 'Never': 0}
-
-        def map_age_category(age):
-            age = int(age)
-            if age >= 80:
-                return 12
-            elif age < 24:
-                return 0
-            return age // 5 - 4
-
-        def map_bmi_category(patient_bmi):
-            if float(patient_bmi) <= 18.5:
-                return 0
-            elif float(patient_bmi) <= 24.9:
-                return 1
-            elif float(patient_bmi) <= 29.9:
-                return 2
-            else:
-                return 3
-
-        data['General_Health'] = general_health_mapping[patient.general_health]
-        data['Exercise'] = int(patient.exercise)
-        data['Skin_Cancer'] = int(patient.skin_cancer)
-        data['Other_Cancer'] = int(patient.other_cancer)
-        data['Depression'] = int(patient.depression)
-        data['Diabetes'] = int(patient.diabetes)
-        data['Arthritis'] = int(patient.arthritis)
-        data['Age_Category'] = map_age_category(patient.age_category)
-        data['Height_(cm)'] = patient.height
-        data['Weight_(kg)'] = patient.weight
-        data['BMI'] = patient.bmi
-        data['Smoking_History'] = -int(patient.smoking_history)
-        data['Alcohol_Consumption'] = patient.alcohol_consumption
-        data['Fruit_Consumption'] = patient.fruit_consumption
-        data['Green_Vegetables_Consumption'] = patient.green_vegetable_consumption
-        data['FriedPotato_Consumption'] = patient.fried_potato_consumption
-        data['BMI_Category'] = map_bmi_category(patient.bmi)
-        data['Checkup_Frequency'] = checkup_mapping[patient.checkup]
-        data['Lifestyle_Score'] = (data['Exercise'] - data['Smoking_History'] + data['Fruit_Consumption'] / 10 +
-                                   data['Green_Vegetables_Consumption'] / 10 - data[
-                                       'Alcohol_Consumption'] / 10)
-        data['Healthy_Diet_Score'] = (data['Fruit_Consumption'] / 10 + data['Green_Vegetables_Consumption'] / 10 -
-
-                                      data['FriedPotato_Consumption'] / 10)
-
-        data['Smoking_Alcohol'] = data['Smoking_History'] * data['Alcohol_Consumption']
-        data['Checkup_Exercise'] = data['Checkup_Frequency'] * data['Exercise']
-        data['Height_to_Weight'] = data['Height_(cm)'] / data['Weight_(kg)']
-
-        data['Fruit_Vegetables'] = data['Fruit_Consumption'] * data['Green_Vegetables_Consumption'] + data[
-            'Fruit_Consumption'] + data['Green_Vegetables_Consumption']
-
-        data['HealthyDiet_Lifestyle'] = data['Healthy_Diet_Score'] * data['Lifestyle_Score']
-
-        data['Alcohol_FriedPotato'] = data['Alcohol_Consumption'] * data['FriedPotato_Consumption'] + data[
-            'Alcohol_Consumption'] + data['FriedPotato_Consumption']
-
-        data['Sex_Female'] = 1 if patient.sex == 'Kadın' else 0
-        data['Sex_Male'] = 1 if patient.sex == 'Erkek' else 0
-
-        df = pd.DataFrame([data])
-
-        model = joblib.load('models/trained_model.pkl')
+        df = pd.DataFrame([build_features(patient)])
+
+        model, version = load_model()
 
+        started = time.perf_counter()
         prediction = model.predict_proba(df)
+        shadow.submit(df, float(prediction[0][1]), version, (time.perf_counter() - started) * 1000)
+        Patient.objects.filter(pk=patient.pk).update(heart_disease_risk=float(prediction[0][1]),
+                                                     risk_model_version=version, risk_scored_at=timezone.now())
+        fragments.invalidate('patient', [patient.pk])
         return Response({'prediction': prediction[0][1]}, status=status.HTTP_200_OK)
 
 
-class ChatbotResponseView(APIView):
+class ExplainHeartDiseaseView(ReadReplicaMixin, PatientSubjectMixin, ScopedThrottleMixin, InFlightLimitMixin,
+                             APIView):
+    throttle_scope = 'predict'
+
+    def get(self, request):
+        try:
+            features = build_features(self.get_patient())
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            return Response({"error": "Patient data is incomplete."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(explain.explain(features), status=status.HTTP_200_OK)
+        except explain.UnsupportedModel as e:
+            return Response({"error": str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+
+class ChatbotResponseView(ScopedThrottleMixin, InFlightLimitMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'chatbot'
+
     def post(self, request, *args, **kwargs):
         message = request.data.get('message', '')
 
-        if not message:
+        if not message or not isinstance(message, str):
             return Response({"error": "Message field is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if chat.estimate_tokens(message) > chat.max_message_tokens():
+            return Response({"error": "Message is too long"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            message = translate_text(text=message, source_language=TR, target_language=EN)
-            result = chat_model.generate_content(message)
+        session = None
+        session_id = request.data.get('session_id')
+        if session_id:
+            session = chat.get_session(request.user, session_id)
+            if session is None:
+                return Response({"error": "Chat session not found or expired"}, status=status.HTTP_404_NOT_FOUND)
 
+        model = resilience.Guarded(chat_model, resilience.upstream('chat'))
+        try:
+            with resilience.deadline(settings.CHATBOT_DEADLINE_SECONDS):
+                message = translate_text(text=message, source_language=TR, target_language=EN)
+                result = model.generate_content(chat.build_contents(session, message, model))
+                # A new conversation only gets a session once there is an exchange to keep, so failed attempts
+                # never evict the user's older sessions.
+                if session is None:
+                    session = chat.create_session(request.user)
+                chat.record_exchange(session, message, result.text)
+                chat_response = translate_text(text=result.text, source_language=EN, target_language=TR)
+        except resilience.UpstreamUnavailable as e:
+            return Response({"error": str(e), "session_id": session and session.pk},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(e.retry_after)})
         except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        chat_response = translate_text(text=result.text, source_language=EN, target_language=TR)
+            return Response({"error": str(e), "session_id": session and session.pk},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         modified_text = re.sub(r'\* +\*+', '\n', chat_response)
         modified_text = re.sub(r'\*\*', '\n', modified_text)
-        return Response({"response": modified_text}, status=status.HTTP_200_OK)
+        return Response({"response": modified_text, "session_id": session.pk}, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAuthenticated & IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "counters": metrics.snapshot(),
+            "db_pools": pool_stats(),
+        }, status=status.HTTP_200_OK)
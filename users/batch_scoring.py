@@ -0,0 +1,169 @@
+import csv
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .features import RAW_FIELDS, feature_frame, load_model, valid_rows
+
+# Patient boolean fields; extracts spell them as True/False, Yes/No or 1/0.
+BOOLEAN_FIELDS = ['exercise', 'skin_cancer', 'other_cancer', 'depression', 'diabetes', 'arthritis', 'smoking_history']
+BOOLEAN_VALUES = {'true': True, 'yes': True, '1': True, '1.0': True,
+                  'false': False, 'no': False, '0': False, '0.0': False}
+
+ROW_COLUMN = 'row'
+OUTPUT_COLUMNS = ['heart_disease_risk', 'model_version']
+
+_model = None
+
+
+def _init_worker(model_path):
+    global _model
+    _model, _ = load_model(model_path)
+
+
+def _score_in_worker(raw):
+    return score_frame(raw, _model)
+
+
+def score_frame(raw, model):
+    """Risk for each row of ``raw`` (one column per field in RAW_FIELDS); NaN for rows that cannot be scored."""
+    flags = pd.DataFrame({field: raw[field].map(lambda value: BOOLEAN_VALUES.get(str(value).strip().lower()))
+                          for field in BOOLEAN_FIELDS})
+    usable = flags.notna().all(axis=1).to_numpy()
+    risk = np.full(len(raw), np.nan)
+    if not usable.any():
+        return risk
+
+    features = feature_frame(raw[usable].assign(**flags[usable].astype(bool)))
+    valid = valid_rows(features)
+    if valid.any():
+        scored = np.flatnonzero(usable)[valid]
+        risk[scored] = model.predict_proba(features[valid])[:, 1]
+    return risk
+
+
+def read_chunks(path, chunk_size, columns, skip=0):
+    """Yield DataFrames of at most ``chunk_size`` rows from a CSV or Parquet file, after the first ``skip`` rows."""
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            if skip >= batch.num_rows:
+                skip -= batch.num_rows
+                continue
+            yield batch.slice(skip).to_pandas()
+            skip = 0
+    else:
+        # Skipped by parsed row rather than by line, so quoted fields spanning lines count once.
+        for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=columns):
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            yield chunk.iloc[skip:]
+            skip = 0
+
+
+def _records(f):
+    """
+    ``(record, end)`` for each CSV record in the binary file ``f``, where ``end`` is the byte offset just past
+    it. A record cut off by the end of the file is left out.
+    """
+    position = {'end': 0, 'complete': True}
+
+    def lines():
+        for line in f:
+            position['end'] += len(line)
+            position['complete'] = line.endswith(b'\n')
+            yield line.decode()
+
+    try:
+        for record in csv.reader(lines()):
+            if not position['complete']:
+                return
+            yield record, position['end']
+    except csv.Error:
+        # Unterminated quoted field at the end of the file.
+        return
+
+
+def completed_rows(path, version):
+    """
+    Number of rows already written to the output file at ``path``. A partly written last row is cut off, and
+    output from another model version is refused rather than mixed.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+
+    rows, first = 0, None
+    with open(path, 'rb+') as f:
+        records = _records(f)
+        header, end = next(records, (None, 0))
+        for record, end in records:
+            rows += 1
+            if first is None:
+                first = dict(zip(header, record))
+        f.truncate(end)
+
+    if first is not None and first.get('model_version') != version:
+        raise ValueError(f"{path} was scored with model {first.get('model_version')} but {version} is deployed; "
+                         f"write to a new output file instead.")
+    return rows
+
+
+def score_file(input_path, output_path, model_path=None, chunk_size=10000, workers=None, id_column=None,
+               log=None):
+    """
+    Score every row of ``input_path`` and append ``row`` (or ``id_column``), ``heart_disease_risk`` and
+    ``model_version`` to the CSV at ``output_path``, in input order.
+
+    Chunks are scored in ``workers`` processes that each load the model once. At most two chunks per worker
+    are in flight, so memory stays bounded by the chunk size rather than the file size. Rows already present
+    in the output are skipped, which makes an interrupted run resumable by re-running the same command.
+    """
+    model_path = str(model_path or settings.HEART_DISEASE_MODEL_PATH)
+    _, version = load_model(model_path)
+    workers = workers or os.cpu_count()
+    done = completed_rows(output_path, version)
+    columns = RAW_FIELDS + ([id_column] if id_column else [])
+    if log and done:
+        log(f"Resuming after {done} rows already in {output_path}")
+
+    stats = {'rows': 0, 'scored': 0, 'skipped': 0, 'resumed_from': done}
+    started = time.perf_counter()
+    pending = deque()
+
+    def write_next(out):
+        ids, future = pending.popleft()
+        risk = future.result()
+        pd.DataFrame({id_column or ROW_COLUMN: ids, 'heart_disease_risk': risk, 'model_version': version}).to_csv(
+            out, header=out.tell() == 0, index=False)
+        out.flush()
+        stats['rows'] += len(risk)
+        stats['scored'] += int(np.isfinite(risk).sum())
+        stats['skipped'] = stats['rows'] - stats['scored']
+        stats['rows_per_sec'] = stats['rows'] / (time.perf_counter() - started)
+        if log:
+            log(f"{done + stats['rows']} rows written, {stats['skipped']} unscorable, "
+                f"{stats['rows_per_sec']:.0f} rows/s")
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+                             initargs=(model_path,)) as pool, open(output_path, 'a', newline='') as out:
+        offset = done
+        for chunk in read_chunks(input_path, chunk_size, columns, skip=done):
+            ids = chunk[id_column].to_numpy() if id_column else np.arange(offset, offset + len(chunk))
+            offset += len(chunk)
+            pending.append((ids, pool.submit(_score_in_worker, chunk[RAW_FIELDS])))
+            if len(pending) >= 2 * workers:
+                write_next(out)
+        while pending:
+            write_next(out)
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
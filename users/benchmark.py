@@ -0,0 +1,227 @@
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+import joblib
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import resilience, synthetic
+from .api import fragments
+from .metrics import percentile
+from .fakes import FakeChatModel, FakeRiskModel, FakeTranslationClient
+from .models import User, Patient, Doctor
+from .synthetic import PASSWORD, HOSPITALS, SPECIALITIES
+from .translation import TranslationBatcher
+
+
+class Fixture:
+    def __init__(self, admin, doctors, patients, spare_tokens):
+        self.admin = admin
+        self.doctors = doctors
+        self.patients = patients
+        self.spare_tokens = spare_tokens
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # Shared by every test of a TestCase (setUpTestData deep-copies class attributes); it is never mutated
+        # apart from the thread-safe counter.
+        return self
+
+    def next_id(self):
+        with self._lock:
+            return next(self._counter)
+
+    def doctor(self, i):
+        return self.doctors[i % len(self.doctors)]
+
+    def patient(self, i):
+        return self.patients[i % len(self.patients)]
+
+
+def seed(num_doctors, num_patients, links_per_patient, spare_tokens=0):
+    population = synthetic.generate(num_doctors, num_patients, links_per_patient, prefix='bench', tokens=True)
+
+    password = make_password(PASSWORD)
+    users = [User(username=f'bench_spare_{i}', email=f'bench_spare_{i}@example.com', password=password)
+             for i in range(spare_tokens)]
+    users += [User(username='bench_admin', email='bench_admin@example.com', password=password, is_staff=True)]
+    users = User.objects.bulk_create(users)
+    tokens = {token.user_id: token.key for token in Token.objects.bulk_create(
+        [Token(user=user, key=Token.generate_key()) for user in users])}
+
+    return Fixture(
+        admin=tokens[users[-1].pk],
+        doctors=[(population.doctor_username(i), population.tokens[pk])
+                 for i, pk in enumerate(population.doctor_ids.tolist())],
+        patients=[(population.patient_username(i), population.tokens[pk])
+                  for i, pk in enumerate(population.patient_ids.tolist())],
+        spare_tokens=[tokens[user.pk] for user in users[:-1]],
+    )
+
+
+def _signup(kind):
+    def build(fixture, i):
+        username = f'bench_{kind}_signup_{fixture.next_id()}'
+        return 'post', {'username': username, 'email': f'{username}@example.com', 'password': PASSWORD,
+                        'password2': PASSWORD}, None
+    return build
+
+
+# Every route in users/api/urls.py, mapped to the request the benchmark sends: (method, payload, token).
+SCENARIOS = {
+    'doctor_signup': _signup('doctor'),
+    'patient_signup': _signup('patient'),
+    'auth_token': lambda f, i: ('post', {'username': f.patient(i)[0], 'password': PASSWORD}, None),
+    'logout': lambda f, i: ('post', None, f.spare_tokens[f.next_id() % len(f.spare_tokens)]),
+    'doctor_dashboard': lambda f, i: ('get', None, f.doctor(i)[1]),
+    'patient_dashboard': lambda f, i: ('get', None, f.patient(i)[1]),
+    'add_doctor_to_patient': lambda f, i: ('put', {'doctor_username': f.doctor(i)[0]}, f.patient(i)[1]),
+    'add_patient_to_doctor': lambda f, i: ('put', {'patient_username': f.patient(i)[0]}, f.doctor(i)[1]),
+    'list_doctors_of_patient': lambda f, i: ('get', None, f.patient(i)[1]),
+    'list_patients_of_doctor': lambda f, i: ('get', None, f.doctor(i)[1]),
+    'list_all_patients': lambda f, i: ('get', None, f.doctor(i)[1]),
+    'doctor_directory': lambda f, i: ('get', {'speciality': SPECIALITIES[i % len(SPECIALITIES)], 'min_years': 5},
+                                      f.patient(i)[1]),
+    'update_doctor': lambda f, i: ('put', {'hospital': HOSPITALS[i % len(HOSPITALS)]}, f.doctor(i)[1]),
+    'update_patient': lambda f, i: ('put', {'weight': 60 + i % 40}, f.patient(i)[1]),
+    'vitals_trend': lambda f, i: ('get', {'period': 'day'}, f.patient(i)[1]),
+    'population_analytics': lambda f, i: ('get', None, f.doctor(i)[1]),
+    'is_patient': lambda f, i: ('get', None, f.patient(i)[1]),
+    'predict_heart_disease': lambda f, i: ('get', None, f.patient(i)[1]),
+    'explain_heart_disease': lambda f, i: ('get', None, f.patient(i)[1]),
+    'chatbot': lambda f, i: ('post', {'message': 'Kalp sağlığım için ne yapmalıyım?'}, f.patient(i)[1]),
+    'metrics': lambda f, i: ('get', None, f.admin),
+}
+
+
+def fake_upstreams(latency=0.0, slow_rate=0.0, slow_latency=1.0, failure_rate=0.0):
+    """Patch the translation, generative-model and risk-model clients with offline fakes."""
+    faults = {'latency': latency, 'slow_rate': slow_rate, 'slow_latency': slow_latency, 'failure_rate': failure_rate}
+    stack = ExitStack()
+    stack.callback(resilience.reset)
+    stack.enter_context(mock.patch('users.translation._batcher',
+                                   TranslationBatcher(client=FakeTranslationClient(**faults))))
+    stack.enter_context(mock.patch('users.api.views.chat_model', FakeChatModel(**faults)))
+    model_file = tempfile.NamedTemporaryFile(suffix='.pkl', delete=False)
+    model_file.close()
+    stack.callback(os.remove, model_file.name)
+    joblib.dump(FakeRiskModel(), model_file.name)
+    stack.enter_context(override_settings(HEART_DISEASE_MODEL_PATH=model_file.name))
+    return stack
+
+
+def unthrottled():
+    """Lift rate and concurrency limits so the benchmark measures the handlers rather than 429s."""
+    return override_settings(
+        REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}},
+        MAX_IN_FLIGHT={},
+    )
+
+
+# Endpoints answered from the per-object fragment cache, benchmarked cold and warm with --fragment-cache.
+FRAGMENT_SCENARIOS = ['doctor_dashboard', 'patient_dashboard', 'list_doctors_of_patient', 'list_patients_of_doctor',
+                      'list_all_patients']
+
+
+def cold_fragments():
+    """Swap the fragment cache for a dummy backend so every request serializes from the database."""
+    return override_settings(CACHES={
+        **settings.CACHES,
+        fragments.CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    })
+
+
+def warm_fragments():
+    fragments.get_many('patient', Patient.objects.values_list('pk', flat=True))
+    fragments.get_many('doctor', Doctor.objects.values_list('pk', flat=True))
+
+
+def run_scenario(name, fixture, requests, concurrency):
+    build = SCENARIOS[name]
+    url = reverse(name)
+    latencies = []
+    errors = []
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def worker():
+        client = APIClient()
+        try:
+            while True:
+                with lock:
+                    i = next(counter)
+                if i >= requests:
+                    return
+                method, payload, token = build(fixture, i)
+                if token:
+                    client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+                else:
+                    client.credentials()
+                started = time.perf_counter()
+                response = getattr(client, method)(url, payload, format='json')
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for name, current in results['endpoints'].items():
+        if current['errors']:
+            regressions.append(f"{name}: {current['errors']} failed requests")
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            if current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {current[key]} > baseline {previous[key]}")
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput_rps']} rps < "
+                               f"baseline {previous['throughput_rps']} rps")
+    return regressions
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def dump(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChatSession, ChatTurn
+
+SUMMARY_PROMPT = ("Summarize the following conversation between a patient and a health assistant in a few "
+                  "sentences. Keep medical facts, symptoms, advice already given and open questions.\n\n")
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text; good enough for budgeting.
+    return max(1, len(text) // 4)
+
+
+def max_message_tokens():
+    """Longest message accepted: half of CHAT_CONTEXT_TOKENS, leaving the other half for the conversation."""
+    return settings.CHAT_CONTEXT_TOKENS // 2
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=settings.CHAT_SESSION_TTL_SECONDS)
+
+
+def get_session(user, session_id):
+    """Return the user's live session with ``session_id``, or None if it does not exist or has expired."""
+    try:
+        return ChatSession.objects.get(pk=session_id, user=user, expires_at__gt=timezone.now())
+    except (ChatSession.DoesNotExist, ValidationError):
+        return None
+
+
+def create_session(user):
+    """Start a session, evicting the user's expired sessions and the oldest ones beyond the per-user cap."""
+    with transaction.atomic():
+        ChatSession.objects.filter(user=user, expires_at__lte=timezone.now()).delete()
+        keep = settings.CHAT_MAX_SESSIONS_PER_USER - 1
+        stale = ChatSession.objects.filter(user=user).order_by('-created_at').values_list('pk', flat=True)[keep:]
+        ChatSession.objects.filter(pk__in=list(stale)).delete()
+        return ChatSession.objects.create(user=user, expires_at=_expiry())
+
+
+def _render(turns):
+    return "\n".join(f"{turn.get_role_display()}: {turn.text}" for turn in turns)
+
+
+def compact(session, turns, incoming_tokens, model):
+    """
+    Fold the oldest turns into the session summary until the remaining turns and the incoming message fit in
+    half of CHAT_CONTEXT_TOKENS, so the prompt stays bounded however long the conversation gets.
+    """
+    budget = settings.CHAT_CONTEXT_TOKENS
+    total = sum(turn.tokens for turn in turns) + incoming_tokens
+    if total <= budget or not turns:
+        return turns
+
+    folded = []
+    while turns and total > budget // 2:
+        turn = turns.pop(0)
+        total -= turn.tokens
+        folded.append(turn)
+
+    # Model answers are not bounded like messages, so keep the summary prompt to the context size too, dropping
+    # the oldest folded text first.
+    earlier = f"Earlier summary: {session.summary}\n" if session.summary else ""
+    rendered = _render(folded)
+    room = max(0, budget * 4 - len(earlier))
+    text = earlier + rendered[max(0, len(rendered) - room):]
+    try:
+        summary = model.generate_content(SUMMARY_PROMPT + text).text
+    except Exception:
+        # Keep the context bounded even when the summary cannot be produced; the oldest turns are dropped.
+        summary = session.summary
+    session.summary = summary[-settings.CHAT_SUMMARY_MAX_CHARS:]
+    with transaction.atomic():
+        session.save(update_fields=['summary'])
+        ChatTurn.objects.filter(pk__in=[turn.pk for turn in folded]).delete()
+    return turns
+
+
+def build_contents(session, message, model):
+    """
+    The bounded multi-turn ``contents`` for ``generate_content``: summary, recent turns, new message. Pass
+    ``session=None`` for the first message of a conversation.
+    """
+    if session is None:
+        return [{'role': 'user', 'parts': [message]}]
+    turns = compact(session, list(session.turns.order_by('pk')), estimate_tokens(message), model)
+    contents = []
+    if session.summary:
+        contents.append({'role': 'user', 'parts': [f"Summary of our conversation so far: {session.summary}"]})
+        contents.append({'role': 'model', 'parts': ["Understood."]})
+    contents.extend({'role': turn.role, 'parts': [turn.text]} for turn in turns)
+    contents.append({'role': 'user', 'parts': [message]})
+    return contents
+
+
+def record_exchange(session, message, answer):
+    ChatTurn.objects.bulk_create([
+        ChatTurn(session=session, role=ChatTurn.USER, text=message, tokens=estimate_tokens(message)),
+        ChatTurn(session=session, role=ChatTurn.MODEL, text=answer, tokens=estimate_tokens(answer)),
+    ])
+    session.expires_at = _expiry()
+    session.save(update_fields=['expires_at'])
+
+
+def purge_expired():
+    return ChatSession.objects.filter(expires_at__lte=timezone.now()).delete()[1].get('users.ChatSession', 0)
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import random
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+from . import metrics
+from .features import RAW_FIELDS, feature_frame, load_model, valid_rows
+from .models import Patient
+
+CACHE_TIMEOUT = 24 * 60 * 60
+# Primary keys probed to sample the average input that linear contributions are measured against.
+BACKGROUND_ROWS = 1000
+
+
+class UnsupportedModel(Exception):
+    pass
+
+
+def feature_hash(features):
+    return hashlib.sha256(json.dumps(features, sort_keys=True, default=float).encode()).hexdigest()
+
+
+def _align(model, X):
+    names = getattr(model, 'feature_names_in_', None)
+    return X[list(names)] if names is not None else X
+
+
+def _linear(model, X, background):
+    # Contributions relative to the average input, so a feature only counts as far as this patient differs from
+    # it; relative to zero, raw height and weight would dominate every explanation. base + sum(contributions)
+    # is exactly the decision function either way.
+    coef = np.ravel(model.coef_)
+    mean = np.zeros(len(coef)) if background is None else background.reindex(X.columns).fillna(0).to_numpy()
+    base = float(np.ravel(model.intercept_)[0] + coef @ mean)
+    return base, coef * (X.to_numpy(dtype=float)[0] - mean)
+
+
+def _add_path(tree, values, nodes, scale, out):
+    """Saabas attribution: each split on the path gets the change in node value it caused."""
+    nodes = np.sort(nodes)
+    parents, children = nodes[:-1], nodes[1:]
+    np.add.at(out, tree.feature[parents], scale * (values[children] - values[parents]))
+
+
+def _node_values(tree, classifier):
+    value = tree.value[:, 0, :]
+    if classifier:
+        # Probability of the positive class at every node.
+        return value[:, -1] / value.sum(axis=1)
+    return value[:, 0]
+
+
+def _path(tree, X32):
+    # The low-level Tree API skips the per-call input validation of estimator.decision_path().
+    return tree.decision_path(X32).indices
+
+
+def _trees(model, X):
+    out = np.zeros(X.shape[1])
+    X32 = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    classifier = hasattr(model, 'predict_proba')
+    if hasattr(model, 'tree_'):
+        _add_path(model.tree_, _node_values(model.tree_, classifier), _path(model.tree_, X32), 1.0, out)
+        return float(model.predict_proba(X)[0, -1] if classifier else model.predict(X)[0]), out
+
+    if isinstance(model.estimators_, np.ndarray):
+        # Gradient boosting: regression trees on the log-odds scale, shrunk by the learning rate.
+        for tree in model.estimators_[:, 0]:
+            _add_path(tree.tree_, _node_values(tree.tree_, False), _path(tree.tree_, X32), model.learning_rate, out)
+        return float(np.ravel(model.decision_function(X))[0]), out
+
+    # Random forest or extra trees: average the per-tree attributions.
+    scale = 1 / len(model.estimators_)
+    for tree in model.estimators_:
+        _add_path(tree.tree_, _node_values(tree.tree_, classifier), _path(tree.tree_, X32), scale, out)
+    return float(model.predict_proba(X)[0, -1] if classifier else model.predict(X)[0]), out
+
+
+def _unwrap(model, X):
+    """Run the preprocessing steps of a Pipeline and return its final estimator with the transformed input."""
+    if hasattr(model, 'steps'):
+        preprocessing = model[:-1]
+        transformed = preprocessing.transform(X)
+        if hasattr(preprocessing, 'get_feature_names_out'):
+            columns = preprocessing.get_feature_names_out()
+        else:
+            columns = X.columns
+        return model[-1], pd.DataFrame(np.asarray(transformed), columns=columns, index=X.index)
+    return model, X
+
+
+def _final(model):
+    return model[-1] if hasattr(model, 'steps') else model
+
+
+def _is_linear(model):
+    estimator = _final(model)
+    return hasattr(estimator, 'coef_') and hasattr(estimator, 'intercept_')
+
+
+def background_means(model, raw):
+    """
+    Average input of the final estimator over the build_features() rows in ``raw``, or the estimator's own
+    ``feature_means_`` (aligned with ``feature_names_in_``) when they were stored with the model at training.
+    """
+    estimator = _final(model)
+    names = getattr(estimator, 'feature_names_in_', None)
+    if hasattr(estimator, 'feature_means_') and names is not None:
+        return pd.Series(np.ravel(estimator.feature_means_), index=names)
+    if raw is None or raw.empty:
+        return None
+    estimator, X = _unwrap(model, raw)
+    return _align(estimator, X).astype(float).mean()
+
+
+def _sample_patients(probes):
+    """
+    Raw rows of a uniform random sample of patients, found by probing ``probes`` random primary keys between the
+    smallest and largest: two index lookups, where ORDER BY RANDOM() would sort the whole table. Keys that
+    belong to other users or were deleted find nothing, so the sample is usually smaller than ``probes``.
+    """
+    bounds = Patient.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    keys = range(bounds['low'], bounds['high'] + 1)
+    return Patient.objects.filter(pk__in=random.sample(keys, min(probes, len(keys)))).values_list(*RAW_FIELDS)
+
+
+def _population_background(model, version):
+    if hasattr(_final(model), 'feature_means_'):
+        return background_means(model, None)
+    key = f'explanation_background:{version}'
+    means = cache.get(key)
+    if means is None:
+        # A random sample, taken once per model version and cache lifetime.
+        raw = pd.DataFrame.from_records(_sample_patients(BACKGROUND_ROWS), columns=RAW_FIELDS)
+        features = feature_frame(raw)
+        means = background_means(model, features[valid_rows(features)])
+        cache.set(key, means, CACHE_TIMEOUT)
+    return means
+
+
+def contributions(model, X, background=None):
+    """
+    Per-feature contributions for the single row in ``X``, as ``(units, base_value, {feature: contribution})``
+    where ``base_value`` plus the contributions reproduces the model output in ``units``.
+
+    Linear models are explained exactly from their coefficients (log-odds), relative to the ``background``
+    means from background_means(). Tree models and forests use Saabas path attribution (probability), and
+    gradient boosting uses it on its log-odds output; both are relative to the training data at the root.
+    """
+    model, X = _unwrap(model, X)
+    X = _align(model, X)
+    if hasattr(model, 'coef_') and hasattr(model, 'intercept_'):
+        units = 'log-odds' if hasattr(model, 'predict_proba') else 'output'
+        base, values = _linear(model, X, background)
+    elif hasattr(model, 'tree_') or hasattr(model, 'estimators_'):
+        output, values = _trees(model, X)
+        units = 'log-odds' if isinstance(getattr(model, 'estimators_', None), np.ndarray) else 'probability'
+        base = output - float(values.sum())
+    else:
+        raise UnsupportedModel(f"Explanations are not supported for {type(model).__name__} models.")
+    return units, base, dict(zip(X.columns, values.tolist()))
+
+
+def explain(features):
+    """
+    Prediction and per-feature contributions for a build_features() dict, cached by feature hash and model
+    version so repeat views skip the model entirely.
+    """
+    model, version = load_model()
+    key = f'explanation:{version}:{feature_hash(features)}'
+    result = cache.get(key)
+    if result is not None:
+        metrics.incr('explain.cache_hit')
+        return result
+
+    metrics.incr('explain.cache_miss')
+    X = pd.DataFrame([features])
+    background = _population_background(model, version) if _is_linear(model) else None
+    units, base, values = contributions(model, X, background)
+    result = {
+        'prediction': float(model.predict_proba(X)[0][1]),
+        'model_version': version,
+        'units': units,
+        'base_value': base,
+        'contributions': [
+            {'feature': feature, 'value': features.get(feature), 'contribution': contribution}
+            for feature, contribution in sorted(values.items(), key=lambda item: -abs(item[1]))
+        ],
+    }
+    cache.set(key, result, CACHE_TIMEOUT)
+    return result
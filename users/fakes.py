@@ -0,0 +1,72 @@
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from google.api_core.exceptions import ServiceUnavailable
+
+
+class FakeUpstream:
+    """
+    Latency and fault injection for the fake upstream clients. Every call sleeps ``latency`` seconds, or
+    ``slow_latency`` for a ``slow_rate`` share of calls and for the next ``slow_next`` calls, and raises
+    ``error`` for a ``failure_rate`` share of calls and for the next ``fail_next`` calls.
+    """
+
+    def __init__(self, latency=0.0, slow_rate=0.0, slow_latency=1.0, failure_rate=0.0, error=ServiceUnavailable, seed=0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.error = error
+        self.slow_next = 0
+        self.fail_next = 0
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def respond(self):
+        with self._lock:
+            self.calls += 1
+            slow = self.slow_next > 0 or self._random.random() < self.slow_rate
+            fail = self.fail_next > 0 or self._random.random() < self.failure_rate
+            self.slow_next = max(0, self.slow_next - 1)
+            self.fail_next = max(0, self.fail_next - 1)
+        time.sleep(self.slow_latency if slow else self.latency)
+        if fail:
+            raise self.error("Injected fault")
+
+
+class FakeTranslationClient(FakeUpstream):
+    """Stands in for ``translate.TranslationServiceClient`` and echoes every segment back."""
+
+    def translate_text(self, request):
+        self.respond()
+        return SimpleNamespace(translations=[
+            SimpleNamespace(translated_text=text) for text in request['contents']
+        ])
+
+
+class FakeChatModel(FakeUpstream):
+    """Stands in for ``genai.GenerativeModel`` with a canned answer."""
+
+    def __init__(self, answer="**Stay active** and keep a balanced diet.", **kwargs):
+        super().__init__(**kwargs)
+        self.answer = answer
+
+    def generate_content(self, contents):
+        self.respond()
+        return SimpleNamespace(text=self.answer)
+
+
+class FakeRiskModel:
+    """Deterministic stand-in for ``models/trained_model.pkl``: a logistic model over three features."""
+    feature_names_in_ = np.array(['Age_Category', 'General_Health', 'BMI_Category'])
+    coef_ = np.array([[0.04, -0.3, 0.2]])
+    intercept_ = np.array([-0.24])
+
+    def predict_proba(self, df):
+        logit = df[list(self.feature_names_in_)].to_numpy(dtype=float) @ self.coef_[0] + self.intercept_[0]
+        positive = 1 / (1 + np.exp(-logit))
+        return np.column_stack([1 - positive, positive])
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+GENERAL_HEALTH_MAPPING = {
+    'Poor': 0,
+    'Fair': 1,
+    'Good': 2,
+    'Very Good': 3,
+    'Excellent': 4
+}
+
+CHECKUP_MAPPING = {'Within the past year': 4, 'Within the past 2 years': 2, 'Within the past 5 years': 1,
+                   '5 or more years ago': 0.2, 'Never': 0}
+
+
+def map_age_category(age):
+    age = int(age)
+    if age >= 80:
+        return 12
+    elif age < 24:
+        return 0
+    return age // 5 - 4
+
+
+def map_bmi_category(patient_bmi):
+    if float(patient_bmi) <= 18.5:
+        return 0
+    elif float(patient_bmi) <= 24.9:
+        return 1
+    elif float(patient_bmi) <= 29.9:
+        return 2
+    else:
+        return 3
+
+
+def build_features(patient):
+    data = {}
+    data['General_Health'] = GENERAL_HEALTH_MAPPING[patient.general_health]
+    data['Exercise'] = int(patient.exercise)
+    data['Skin_Cancer'] = int(patient.skin_cancer)
+    data['Other_Cancer'] = int(patient.other_cancer)
+    data['Depression'] = int(patient.depression)
+    data['Diabetes'] = int(patient.diabetes)
+    data['Arthritis'] = int(patient.arthritis)
+    data['Age_Category'] = map_age_category(patient.age_category)
+    data['Height_(cm)'] = patient.height
+    data['Weight_(kg)'] = patient.weight
+    data['BMI'] = patient.bmi
+    data['Smoking_History'] = -int(patient.smoking_history)
+    data['Alcohol_Consumption'] = patient.alcohol_consumption
+    data['Fruit_Consumption'] = patient.fruit_consumption
+    data['Green_Vegetables_Consumption'] = patient.green_vegetable_consumption
+    data['FriedPotato_Consumption'] = patient.fried_potato_consumption
+    data['BMI_Category'] = map_bmi_category(patient.bmi)
+    data['Checkup_Frequency'] = CHECKUP_MAPPING[patient.checkup]
+    data['Lifestyle_Score'] = (data['Exercise'] - data['Smoking_History'] + data['Fruit_Consumption'] / 10 +
+                               data['Green_Vegetables_Consumption'] / 10 - data[
+                                   'Alcohol_Consumption'] / 10)
+    data['Healthy_Diet_Score'] = (data['Fruit_Consumption'] / 10 + data['Green_Vegetables_Consumption'] / 10 -
+                                  data['FriedPotato_Consumption'] / 10)
+
+    data['Smoking_Alcohol'] = data['Smoking_History'] * data['Alcohol_Consumption']
+    data['Checkup_Exercise'] = data['Checkup_Frequency'] * data['Exercise']
+    data['Height_to_Weight'] = data['Height_(cm)'] / data['Weight_(kg)']
+
+    data['Fruit_Vegetables'] = data['Fruit_Consumption'] * data['Green_Vegetables_Consumption'] + data[
+        'Fruit_Consumption'] + data['Green_Vegetables_Consumption']
+
+    data['HealthyDiet_Lifestyle'] = data['Healthy_Diet_Score'] * data['Lifestyle_Score']
+
+    data['Alcohol_FriedPotato'] = data['Alcohol_Consumption'] * data['FriedPotato_Consumption'] + data[
+        'Alcohol_Consumption'] + data['FriedPotato_Consumption']
+
+    data['Sex_Female'] = 1 if patient.sex == 'Kadın' else 0
+    data['Sex_Male'] = 1 if patient.sex == 'Erkek' else 0
+    return data
+
+
+# Patient fields build_features() reads, i.e. the columns feature_frame() expects.
+RAW_FIELDS = ['general_health', 'exercise', 'skin_cancer', 'other_cancer', 'depression', 'diabetes', 'arthritis',
+              'age_category', 'height', 'weight', 'bmi', 'smoking_history', 'alcohol_consumption',
+              'fruit_consumption', 'green_vegetable_consumption', 'fried_potato_consumption', 'checkup', 'sex']
+
+
+def feature_frame(raw):
+    """
+    Vectorised build_features() over a DataFrame with one column per Patient field in RAW_FIELDS.
+
+    Rows that build_features() would reject (unknown categories, missing or non-numeric measurements) come out
+    with NaN or inf; use valid_rows() to drop them.
+    """
+    df = pd.DataFrame(index=raw.index)
+    df['General_Health'] = raw['general_health'].map(GENERAL_HEALTH_MAPPING)
+    df['Exercise'] = raw['exercise'].astype(int)
+    df['Skin_Cancer'] = raw['skin_cancer'].astype(int)
+    df['Other_Cancer'] = raw['other_cancer'].astype(int)
+    df['Depression'] = raw['depression'].astype(int)
+    df['Diabetes'] = raw['diabetes'].astype(int)
+    df['Arthritis'] = raw['arthritis'].astype(int)
+    age = pd.to_numeric(raw['age_category'], errors='coerce')
+    df['Age_Category'] = np.where(age >= 80, 12, np.where(age < 24, 0, age // 5 - 4))
+    df['Height_(cm)'] = pd.to_numeric(raw['height'], errors='coerce')
+    df['Weight_(kg)'] = pd.to_numeric(raw['weight'], errors='coerce')
+    bmi = pd.to_numeric(raw['bmi'], errors='coerce')
+    df['BMI'] = bmi
+    df['Smoking_History'] = -raw['smoking_history'].astype(int)
+    df['Alcohol_Consumption'] = pd.to_numeric(raw['alcohol_consumption'], errors='coerce')
+    df['Fruit_Consumption'] = pd.to_numeric(raw['fruit_consumption'], errors='coerce')
+    df['Green_Vegetables_Consumption'] = pd.to_numeric(raw['green_vegetable_consumption'], errors='coerce')
+    df['FriedPotato_Consumption'] = pd.to_numeric(raw['fried_potato_consumption'], errors='coerce')
+    df['BMI_Category'] = np.select([bmi <= 18.5, bmi <= 24.9, bmi <= 29.9], [0, 1, 2], 3)
+    df['Checkup_Frequency'] = raw['checkup'].map(CHECKUP_MAPPING)
+    df['Lifestyle_Score'] = (df['Exercise'] - df['Smoking_History'] + df['Fruit_Consumption'] / 10 +
+                             df['Green_Vegetables_Consumption'] / 10 - df['Alcohol_Consumption'] / 10)
+    df['Healthy_Diet_Score'] = (df['Fruit_Consumption'] / 10 + df['Green_Vegetables_Consumption'] / 10 -
+                                df['FriedPotato_Consumption'] / 10)
+    df['Smoking_Alcohol'] = df['Smoking_History'] * df['Alcohol_Consumption']
+    df['Checkup_Exercise'] = df['Checkup_Frequency'] * df['Exercise']
+    df['Height_to_Weight'] = df['Height_(cm)'] / df['Weight_(kg)']
+    df['Fruit_Vegetables'] = (df['Fruit_Consumption'] * df['Green_Vegetables_Consumption'] +
+                              df['Fruit_Consumption'] + df['Green_Vegetables_Consumption'])
+    df['HealthyDiet_Lifestyle'] = df['Healthy_Diet_Score'] * df['Lifestyle_Score']
+    df['Alcohol_FriedPotato'] = (df['Alcohol_Consumption'] * df['FriedPotato_Consumption'] +
+                                 df['Alcohol_Consumption'] + df['FriedPotato_Consumption'])
+    df['Sex_Female'] = (raw['sex'] == 'Kadın').astype(int)
+    df['Sex_Male'] = (raw['sex'] == 'Erkek').astype(int)
+    return df
+
+
+def valid_rows(features):
+    return np.isfinite(features.to_numpy(dtype=float)).all(axis=1)
+
+
+_model_cache = {}
+_model_lock = threading.Lock()
+
+
+def load_model(path=None):
+    """
+    Return ``(model, version)`` for the heart-disease model, loading it once per process and again only when
+    the file changes. The version is a short hash of the file contents.
+    """
+    path = str(path or settings.HEART_DISEASE_MODEL_PATH)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _model_lock:
+        cached = _model_cache.get(path)
+        if cached is None or cached[0] != key:
+            with open(path, 'rb') as f:
+                version = hashlib.sha256(f.read()).hexdigest()[:12]
+            cached = _model_cache[path] = (key, joblib.load(path), version)
+    return cached[1], cached[2]
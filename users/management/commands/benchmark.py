@@ -0,0 +1,116 @@
+import json
+import platform
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+from users import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway test database, drive every API route concurrently against offline fakes of the "
+            "upstream clients and report throughput and p50/p95/p99 latency per endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=500)
+        parser.add_argument('--links', type=int, default=3, help="Doctors linked to each patient.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests sent to each endpoint.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--upstream-latency-ms', type=float, default=0.0,
+                            help="Latency injected into the fake translation and generative-model clients.")
+        parser.add_argument('--upstream-slow-rate', type=float, default=0.0,
+                            help="Share of fake upstream calls that take --upstream-slow-ms instead.")
+        parser.add_argument('--upstream-slow-ms', type=float, default=1000.0)
+        parser.add_argument('--upstream-failure-rate', type=float, default=0.0,
+                            help="Share of fake upstream calls that fail with a 503.")
+        parser.add_argument('--endpoint', action='append', choices=sorted(benchmark.SCENARIOS),
+                            help="Only benchmark the given endpoint(s).")
+        parser.add_argument('--output', default=str(settings.BASE_DIR / 'bench_output.json'))
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'benchmarks' / 'baseline.json'))
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed relative slowdown against the baseline before the run fails.")
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Store this run as the new baseline instead of comparing against it.")
+        parser.add_argument('--no-compare', action='store_true',
+                            help="Only report this run; without it, a missing baseline fails the run.")
+        parser.add_argument('--throttle', action='store_true',
+                            help="Keep the configured rate and concurrency limits in place.")
+        parser.add_argument('--fragment-cache', action='store_true',
+                            help="Also run the list and dashboard endpoints with a cold and a pre-warmed fragment "
+                                 "cache, reported as <endpoint>[cold] and <endpoint>[warm].")
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        endpoints = options['endpoint'] or list(benchmark.SCENARIOS)
+
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            fixture = benchmark.seed(options['doctors'], options['patients'], options['links'],
+                                     spare_tokens=options['requests'])
+            results = {'meta': {
+                'doctors': options['doctors'],
+                'patients': options['patients'],
+                'links': options['links'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'upstream_latency_ms': options['upstream_latency_ms'],
+                'upstream_slow_rate': options['upstream_slow_rate'],
+                'upstream_slow_ms': options['upstream_slow_ms'],
+                'upstream_failure_rate': options['upstream_failure_rate'],
+                'throttle': options['throttle'],
+                'python': platform.python_version(),
+            }, 'endpoints': {}}
+            with ExitStack() as stack:
+                stack.enter_context(benchmark.fake_upstreams(
+                    latency=options['upstream_latency_ms'] / 1000, slow_rate=options['upstream_slow_rate'],
+                    slow_latency=options['upstream_slow_ms'] / 1000, failure_rate=options['upstream_failure_rate']))
+                if not options['throttle']:
+                    stack.enter_context(benchmark.unthrottled())
+                for name in endpoints:
+                    self.run_and_report(results, name, name, fixture, options)
+                if options['fragment_cache']:
+                    cached = [name for name in benchmark.FRAGMENT_SCENARIOS if name in endpoints]
+                    with benchmark.cold_fragments():
+                        for name in cached:
+                            self.run_and_report(results, f'{name}[cold]', name, fixture, options)
+                    benchmark.warm_fragments()
+                    for name in cached:
+                        self.run_and_report(results, f'{name}[warm]', name, fixture, options)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        benchmark.dump(results, options['output'])
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['save_baseline']:
+            benchmark.dump(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}"))
+            return
+        if options['no_compare']:
+            return
+
+        try:
+            baseline = benchmark.load(options['baseline'])
+        except FileNotFoundError:
+            raise CommandError(f"No baseline at {options['baseline']}: create one with --save-baseline on a "
+                               f"known-good build, or pass --no-compare to skip the comparison.")
+        except json.JSONDecodeError as e:
+            raise CommandError(f"Invalid baseline {options['baseline']}: {e}")
+
+        regressions = benchmark.compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No performance regressions."))
+
+    def run_and_report(self, results, label, name, fixture, options):
+        stats = benchmark.run_scenario(name, fixture, options['requests'], options['concurrency'])
+        results['endpoints'][label] = stats
+        self.stdout.write(f"{label:<32} {stats['throughput_rps']:>9.1f} rps  p50 {stats['p50_ms']:>8.2f} ms"
+                          f"  p95 {stats['p95_ms']:>8.2f} ms  p99 {stats['p99_ms']:>8.2f} ms"
+                          f"  errors {stats['errors']}")
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from users import synthetic
+
+
+class Command(BaseCommand):
+    help = ("Bulk-load a synthetic population of doctors and patients, with their users, emergency contacts and "
+            "doctor/patient links, for load tests and capacity planning. Never run this against production.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=1000)
+        parser.add_argument('--patients', type=int, default=100_000)
+        parser.add_argument('--links', type=int, default=3, help="Doctors linked to each patient.")
+        parser.add_argument('--emergency-contacts', type=float, default=0.5,
+                            help="Share of patients with an emergency contact.")
+        parser.add_argument('--prefix', default='synthetic',
+                            help="Username prefix; use a new one to load a second population.")
+        parser.add_argument('--tokens', action='store_true', help="Also create an API token for every user.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=50_000)
+        parser.add_argument('--skip-analytics', action='store_true',
+                            help="Do not rebuild the population analytics afterwards (run rebuild_analytics later).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            population = synthetic.generate(
+                options['doctors'], options['patients'], links_per_patient=options['links'],
+                emergency_contact_rate=options['emergency_contacts'], prefix=options['prefix'],
+                tokens=options['tokens'], seed=options['seed'], batch_size=options['batch_size'],
+                rebuild_analytics=not options['skip_analytics'], log=self.stdout.write,
+            )
+        except IntegrityError as e:
+            raise CommandError(f"{e}\nA population with prefix '{options['prefix']}' probably exists already; "
+                               f"pass a different --prefix.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(population.doctor_ids)} doctors and {len(population.patient_ids)} patients in "
+            f"{time.perf_counter() - started:.1f} s"))
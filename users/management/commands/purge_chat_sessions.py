@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users import chat
+
+
+class Command(BaseCommand):
+    help = "Delete expired chatbot sessions and their turns."
+
+    def handle(self, *args, **options):
+        deleted = chat.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired chat sessions."))
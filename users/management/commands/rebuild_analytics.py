@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from users import analytics
+
+
+class Command(BaseCommand):
+    help = ("Recompute the population analytics summary tables from scratch. Needed after bulk loads that "
+            "bypass model signals; day-to-day changes keep them up to date incrementally.")
+
+    def handle(self, *args, **options):
+        analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS("Population analytics rebuilt."))
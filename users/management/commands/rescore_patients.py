@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users import rescoring
+from users.models import RescoreJob
+
+
+class Command(BaseCommand):
+    help = ("Recompute every patient's heart-disease risk with the deployed model, in primary-key chunks, "
+            "checkpointing after each chunk so an interrupted run can be resumed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--max-duty', type=float, default=0.5,
+                            help="Fraction of wall time spent working; the rest is spent sleeping between chunks.")
+        parser.add_argument('--resume', nargs='?', const='latest', metavar='JOB_ID',
+                            help="Resume the given job, or the most recent unfinished one.")
+
+    def handle(self, *args, **options):
+        claimed = False
+        if options['resume'] == 'latest':
+            job = RescoreJob.objects.filter(rescoring.resumable()).order_by('-started_at').first()
+            if job is None:
+                raise CommandError("There is no re-scoring job to resume: every job is done or still running.")
+        elif options['resume']:
+            try:
+                job = RescoreJob.objects.get(pk=options['resume'])
+            except (RescoreJob.DoesNotExist, ValueError):
+                raise CommandError(f"Re-scoring job {options['resume']} does not exist.")
+        else:
+            job = rescoring.start_job()
+            claimed = True
+
+        self.stdout.write(f"Running {job} from pk {job.last_pk}")
+        try:
+            rescoring.run_job(job, chunk_size=options['chunk_size'], max_duty=options['max_duty'],
+                              log=self.stdout.write, claimed=claimed)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"{job}: {job.processed} patients scored, {job.skipped} skipped, {job.rows_per_sec:.0f} rows/s"))
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count, F, Max, Q
+from django.db.models.functions import Abs
+from django.utils import timezone
+
+from users.metrics import percentile
+from users.models import ShadowPrediction
+
+
+class Command(BaseCommand):
+    help = "Summarise how the shadow heart-disease model agrees with, and how fast it is compared to, production."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help="Only look at the last N hours.")
+        parser.add_argument('--shadow-version', help="Only look at this shadow model version.")
+        parser.add_argument('--threshold', type=float, default=0.5,
+                            help="Scores at or above this count as a positive prediction when comparing labels.")
+
+    def handle(self, *args, **options):
+        rows = ShadowPrediction.objects.filter(created_at__gte=timezone.now() - timedelta(hours=options['hours']))
+        if options['shadow_version']:
+            rows = rows.filter(shadow_version=options['shadow_version'])
+
+        threshold = options['threshold']
+        both_positive = Q(production_score__gte=threshold, shadow_score__gte=threshold)
+        both_negative = Q(production_score__lt=threshold, shadow_score__lt=threshold)
+        summary = rows.aggregate(
+            total=Count('pk'),
+            agreeing=Count('pk', filter=both_positive | both_negative),
+            mean_delta=Avg(F('shadow_score') - F('production_score')),
+            mean_abs_delta=Avg(Abs(F('shadow_score') - F('production_score'))),
+            max_abs_delta=Max(Abs(F('shadow_score') - F('production_score'))),
+        )
+        if not summary['total']:
+            raise CommandError("No shadow predictions in the selected window.")
+
+        production_ms = sorted(rows.values_list('production_ms', flat=True))
+        shadow_ms = sorted(rows.values_list('shadow_ms', flat=True))
+        versions = rows.values_list('production_version', 'shadow_version').distinct()
+
+        self.stdout.write(f"Predictions:        {summary['total']}")
+        self.stdout.write(f"Model versions:     " + ", ".join(f"{p} -> {s}" for p, s in versions))
+        self.stdout.write(f"Label agreement:    {summary['agreeing'] / summary['total']:.2%} at threshold {threshold}")
+        self.stdout.write(f"Score delta:        mean {summary['mean_delta']:+.4f}, mean abs "
+                          f"{summary['mean_abs_delta']:.4f}, max abs {summary['max_abs_delta']:.4f}")
+        for name, values in (('Production', production_ms), ('Shadow', shadow_ms)):
+            self.stdout.write(f"{name + ' latency:':<20}p50 {percentile(values, 50):.2f} ms, "
+                              f"p95 {percentile(values, 95):.2f} ms, p99 {percentile(values, 99):.2f} ms")
+        speedup = percentile(production_ms, 50) / percentile(shadow_ms, 50) if percentile(shadow_ms, 50) else 0
+        self.stdout.write(f"Relative speed:     shadow runs {speedup:.2f}x as fast as production at p50")
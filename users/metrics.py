@@ -0,0 +1,31 @@
+from django.core.cache import cache
+
+KEY_PREFIX = 'metrics:'
+NAMES_KEY = KEY_PREFIX + '__names__'
+
+
+def incr(name, value=1):
+    """Increment a counter kept in the shared cache so every worker reports into the same number."""
+    key = KEY_PREFIX + name
+    if cache.add(key, 0, timeout=None):
+        names = cache.get(NAMES_KEY, set())
+        names.add(name)
+        cache.set(NAMES_KEY, names, timeout=None)
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        cache.set(key, value, timeout=None)
+
+
+def snapshot():
+    names = sorted(cache.get(NAMES_KEY, set()))
+    values = cache.get_many([KEY_PREFIX + name for name in names])
+    return {name: values.get(KEY_PREFIX + name, 0) for name in names}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
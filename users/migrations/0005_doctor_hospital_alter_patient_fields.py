@@ -0,0 +1,68 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_patient_emergency_contact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='hospital',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='arthritis',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='checkup',
+            field=models.CharField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='depression',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='diabetes',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='exercise',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='general_health',
+            field=models.CharField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='heart_disease',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='other_cancer',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='skin_cancer',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='smoking_history',
+            field=models.BooleanField(default=False),
+        ),
+    ]
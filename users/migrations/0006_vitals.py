@@ -0,0 +1,64 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:46
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_doctor_hospital_alter_patient_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('h', 'Hour'), ('d', 'Day'), ('m', 'Month')], max_length=1)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('height_sum', models.FloatField(default=0)),
+                ('weight_sum', models.FloatField(default=0)),
+                ('weight_min', models.PositiveSmallIntegerField()),
+                ('weight_max', models.PositiveSmallIntegerField()),
+                ('bmi_sum', models.FloatField(default=0)),
+                ('bmi_min', models.FloatField()),
+                ('bmi_max', models.FloatField()),
+                ('alcohol_consumption_sum', models.FloatField(default=0)),
+                ('fruit_consumption_sum', models.FloatField(default=0)),
+                ('green_vegetable_consumption_sum', models.FloatField(default=0)),
+                ('fried_potato_consumption_sum', models.FloatField(default=0)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vitals_rollups', to='users.patient')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VitalsMeasurement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('height', models.PositiveSmallIntegerField()),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('bmi', models.FloatField()),
+                ('alcohol_consumption', models.FloatField()),
+                ('fruit_consumption', models.FloatField()),
+                ('green_vegetable_consumption', models.FloatField()),
+                ('fried_potato_consumption', models.FloatField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='measurements', to='users.patient')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='vitalsrollup',
+            constraint=models.UniqueConstraint(fields=('patient', 'period', 'bucket'), name='unique_vitals_rollup_bucket'),
+        ),
+        migrations.AddIndex(
+            model_name='vitalsmeasurement',
+            index=models.Index(fields=['patient', '-recorded_at'], name='vitals_patient_recorded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vitalsmeasurement',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['recorded_at'], name='vitals_recorded_brin'),
+        ),
+    ]
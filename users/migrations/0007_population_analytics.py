@@ -0,0 +1,48 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_vitals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('age_group', models.SmallIntegerField()),
+                ('sex', models.CharField(max_length=10)),
+                ('patients', models.IntegerField(default=0)),
+                ('diabetes', models.IntegerField(default=0)),
+                ('depression', models.IntegerField(default=0)),
+                ('heart_disease', models.IntegerField(default=0)),
+                ('general_health_poor', models.IntegerField(default=0)),
+                ('general_health_fair', models.IntegerField(default=0)),
+                ('general_health_good', models.IntegerField(default=0)),
+                ('general_health_very_good', models.IntegerField(default=0)),
+                ('general_health_excellent', models.IntegerField(default=0)),
+                ('general_health_unknown', models.IntegerField(default=0)),
+                ('bmi_sum', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DoctorStats',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='users.doctor')),
+                ('patients', models.IntegerField(default=0)),
+                ('bmi_sum', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cohortstats',
+            constraint=models.UniqueConstraint(fields=('age_group', 'sex'), name='unique_cohort_stats'),
+        ),
+    ]
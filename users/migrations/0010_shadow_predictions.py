@@ -0,0 +1,30 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_chat_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShadowPrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('production_version', models.CharField(max_length=12)),
+                ('shadow_version', models.CharField(max_length=12)),
+                ('production_score', models.FloatField()),
+                ('shadow_score', models.FloatField()),
+                ('production_ms', models.FloatField()),
+                ('shadow_ms', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shadow_version', 'created_at'], name='shadow_version_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.9 on 2026-10-19 13:02
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_shadow_predictions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='hospital',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='doctor',
+            name='speciality',
+            field=models.CharField(blank=True, db_index=True, max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='risk_scored_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('username'), name='varchar_pattern_ops'), name='user_username_upper_idx'),
+        ),
+    ]
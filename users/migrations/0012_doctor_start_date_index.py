@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='start_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import BrinIndex, OpClass
+from django.db.models.functions import Upper
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
 from django.db.models.signals import post_save
 from django.conf import settings
@@ -12,6 +17,12 @@ class User(AbstractUser):
     birth_date = models.DateField(null=True, blank=True)
     gender = models.CharField(max_length=10, null=True, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Prefix searches (``^username`` in the admin) compile to UPPER(username) LIKE 'X%'.
+            models.Index(OpClass(Upper('username'), name='varchar_pattern_ops'), name='user_username_upper_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -50,6 +61,9 @@ class Patient(models.Model):
     fruit_consumption = models.FloatField(default=False)
     green_vegetable_consumption = models.FloatField(default=False)
     fried_potato_consumption = models.FloatField(default=False)
+    heart_disease_risk = models.FloatField(null=True, blank=True)
+    risk_model_version = models.CharField(max_length=64, null=True, blank=True)
+    risk_scored_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return self.user.username
@@ -57,16 +71,174 @@ class Patient(models.Model):
 
 class Doctor(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
-    speciality = models.CharField(max_length=50, null=True, blank=True)
+    speciality = models.CharField(max_length=50, null=True, blank=True, db_index=True)
     background = models.TextField(null=True, blank=True)
-    start_date = models.DateField(null=True, blank=True)
-    hospital = models.CharField(max_length=100, null=True, blank=True)
+    start_date = models.DateField(null=True, blank=True, db_index=True)
+    hospital = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     patients = models.ManyToManyField(Patient, related_name='doctors', blank=True)
 
     def __str__(self):
         return self.user.username
 
 
+class VitalsMeasurement(models.Model):
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='measurements')
+    recorded_at = models.DateTimeField(default=timezone.now)
+    height = models.PositiveSmallIntegerField()
+    weight = models.PositiveSmallIntegerField()
+    bmi = models.FloatField()
+    alcohol_consumption = models.FloatField()
+    fruit_consumption = models.FloatField()
+    green_vegetable_consumption = models.FloatField()
+    fried_potato_consumption = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', '-recorded_at'], name='vitals_patient_recorded_idx'),
+            # Rows are appended in time order, so a BRIN index prunes time ranges at a fraction of a B-tree's size.
+            BrinIndex(fields=['recorded_at'], name='vitals_recorded_brin'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient} @ {self.recorded_at:%Y-%m-%d %H:%M}"
+
+
+class VitalsRollup(models.Model):
+    HOUR = 'h'
+    DAY = 'd'
+    MONTH = 'm'
+    PERIOD_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day'), (MONTH, 'Month')]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vitals_rollups')
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    height_sum = models.FloatField(default=0)
+    weight_sum = models.FloatField(default=0)
+    weight_min = models.PositiveSmallIntegerField()
+    weight_max = models.PositiveSmallIntegerField()
+    bmi_sum = models.FloatField(default=0)
+    bmi_min = models.FloatField()
+    bmi_max = models.FloatField()
+    alcohol_consumption_sum = models.FloatField(default=0)
+    fruit_consumption_sum = models.FloatField(default=0)
+    green_vegetable_consumption_sum = models.FloatField(default=0)
+    fried_potato_consumption_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'period', 'bucket'], name='unique_vitals_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient} {self.get_period_display()} {self.bucket:%Y-%m-%d %H:%M}"
+
+
+class CohortStats(models.Model):
+    age_group = models.SmallIntegerField()
+    sex = models.CharField(max_length=10)
+    patients = models.IntegerField(default=0)
+    diabetes = models.IntegerField(default=0)
+    depression = models.IntegerField(default=0)
+    heart_disease = models.IntegerField(default=0)
+    general_health_poor = models.IntegerField(default=0)
+    general_health_fair = models.IntegerField(default=0)
+    general_health_good = models.IntegerField(default=0)
+    general_health_very_good = models.IntegerField(default=0)
+    general_health_excellent = models.IntegerField(default=0)
+    general_health_unknown = models.IntegerField(default=0)
+    bmi_sum = models.FloatField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['age_group', 'sex'], name='unique_cohort_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.age_group}/{self.sex}"
+
+
+class DoctorStats(models.Model):
+    doctor = models.OneToOneField(Doctor, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    patients = models.IntegerField(default=0)
+    bmi_sum = models.FloatField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return str(self.doctor)
+
+
+class RescoreJob(models.Model):
+    RUNNING = 'running'
+    INTERRUPTED = 'interrupted'
+    FAILED = 'failed'
+    DONE = 'done'
+    STATUS_CHOICES = [(RUNNING, 'Running'), (INTERRUPTED, 'Interrupted'), (FAILED, 'Failed'), (DONE, 'Done')]
+
+    model_version = models.CharField(max_length=64)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=RUNNING)
+    last_pk = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    rows_per_sec = models.FloatField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Re-score #{self.pk} ({self.model_version}, {self.status})"
+
+
+class ChatSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_sessions')
+    summary = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='chat_session_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.pk}"
+
+
+class ChatTurn(models.Model):
+    USER = 'user'
+    MODEL = 'model'
+    ROLE_CHOICES = [(USER, 'User'), (MODEL, 'Model')]
+
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='turns')
+    role = models.CharField(max_length=5, choices=ROLE_CHOICES)
+    text = models.TextField()
+    tokens = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.role}: {self.text[:50]}"
+
+
+class ShadowPrediction(models.Model):
+    created_at = models.DateTimeField(default=timezone.now)
+    production_version = models.CharField(max_length=12)
+    shadow_version = models.CharField(max_length=12)
+    production_score = models.FloatField()
+    shadow_score = models.FloatField()
+    production_ms = models.FloatField()
+    shadow_ms = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['shadow_version', 'created_at'], name='shadow_version_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.production_version} vs {self.shadow_version} @ {self.created_at:%Y-%m-%d %H:%M}"
+
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
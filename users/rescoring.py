@@ -0,0 +1,136 @@
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .api import fragments
+from .features import RAW_FIELDS, feature_frame, load_model, valid_rows
+from .models import Patient, RescoreJob
+
+RISK_FIELDS = ['heart_disease_risk', 'risk_model_version', 'risk_scored_at']
+
+# A running job checkpoints, and so refreshes updated_at, after every chunk. One that has not for this long is
+# presumed dead and may be claimed by another worker.
+LEASE_SECONDS = 300
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def resumable():
+    """Jobs that may be claimed: unfinished and not checkpointed by a live worker within LEASE_SECONDS."""
+    stale = timezone.now() - timedelta(seconds=LEASE_SECONDS)
+    return ~Q(status=RescoreJob.DONE) & (~Q(status=RescoreJob.RUNNING) | Q(updated_at__lt=stale))
+
+
+def claim(job):
+    """Atomically mark ``job`` as running for this worker; False if it is done or another worker holds it."""
+    claimed = RescoreJob.objects.filter(resumable(), pk=job.pk).update(status=RescoreJob.RUNNING,
+                                                                       updated_at=timezone.now())
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def start_job():
+    """A new job for the deployed model, already claimed by the caller."""
+    _, version = load_model()
+    return RescoreJob.objects.create(model_version=version)
+
+
+def score_chunk(rows, model, version, now):
+    """Score a chunk of ``Patient.objects.values('pk', *RAW_FIELDS)`` rows; return the Patients to update."""
+    raw = pd.DataFrame.from_records(rows, index='pk', columns=['pk'] + RAW_FIELDS)
+    features = feature_frame(raw)
+    valid = valid_rows(features)
+    if not valid.any():
+        return []
+    risks = model.predict_proba(features[valid])[:, 1]
+    return [Patient(pk=pk, heart_disease_risk=float(risk), risk_model_version=version, risk_scored_at=now)
+            for pk, risk in zip(features.index[valid], risks)]
+
+
+def run_job(job, chunk_size=500, max_duty=0.5, log=None, claimed=False):
+    """
+    Re-score every patient after ``job.last_pk`` in primary-key order, claiming the job first unless the
+    caller already has (see claim()).
+
+    Each chunk's results and the job checkpoint commit in one transaction, so a crashed or interrupted job
+    resumes exactly where it stopped. The checkpoint also renews the job's lease; if another worker has taken
+    over a job presumed dead, this one stops without writing. After every chunk the job sleeps long enough to
+    keep its share of wall time at ``max_duty``, leaving database and CPU headroom for online traffic.
+    """
+    model, version = load_model()
+    if version != job.model_version:
+        raise ValueError(f"Job #{job.pk} was started for model {job.model_version} but {version} is deployed; "
+                         f"start a new job instead.")
+    if not claimed and not claim(job):
+        raise ValueError(f"Job #{job.pk} is done or running in another worker.")
+
+    started = time.perf_counter()
+    processed_at_start = job.processed + job.skipped
+    try:
+        while True:
+            chunk_started = time.perf_counter()
+            rows = list(Patient.objects.filter(pk__gt=job.last_pk).order_by('pk').values('pk', *RAW_FIELDS)
+                        [:chunk_size])
+            if not rows:
+                break
+
+            scored = score_chunk(rows, model, version, timezone.now())
+            with transaction.atomic():
+                current = RescoreJob.objects.select_for_update().only('updated_at').get(pk=job.pk)
+                if current.updated_at != job.updated_at:
+                    raise LeaseLost(f"Job #{job.pk} was taken over by another worker.")
+                Patient.objects.bulk_update(scored, RISK_FIELDS)
+                # Deferred by invalidate() until this chunk commits.
+                fragments.invalidate('patient', [patient.pk for patient in scored])
+                job.last_pk = rows[-1]['pk']
+                job.processed += len(scored)
+                job.skipped += len(rows) - len(scored)
+                job.rows_per_sec = (job.processed + job.skipped - processed_at_start) / (
+                        time.perf_counter() - started)
+                job.save(update_fields=['last_pk', 'processed', 'skipped', 'rows_per_sec', 'updated_at'])
+            if log:
+                log(f"Job #{job.pk}: {job.processed} scored, {job.skipped} skipped, up to pk {job.last_pk}, "
+                    f"{job.rows_per_sec:.0f} rows/s")
+
+            if 0 < max_duty < 1:
+                time.sleep((time.perf_counter() - chunk_started) * (1 / max_duty - 1))
+    except LeaseLost:
+        raise
+    except KeyboardInterrupt:
+        job.status = RescoreJob.INTERRUPTED
+        job.save(update_fields=['status', 'updated_at'])
+        raise
+    except Exception as e:
+        job.status = RescoreJob.FAILED
+        job.error = repr(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+
+    job.status = RescoreJob.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return job
+
+
+def run_job_in_background(job, claimed=False, **kwargs):
+    """Claim ``job`` here, then run it in a daemon thread. Returns None if the job could not be claimed."""
+    if not claimed and not claim(job):
+        return None
+
+    def target():
+        try:
+            run_job(job, claimed=True, **kwargs)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=target, name=f'rescore-job-{job.pk}', daemon=True)
+    thread.start()
+    return thread
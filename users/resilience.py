@@ -0,0 +1,248 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from django.conf import settings
+from google.api_core import exceptions as google_exceptions
+
+from . import metrics
+from .metrics import percentile
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream could not answer in time; callers should fail fast with a 503 rather than a 500."""
+    retry_after = 1
+
+
+class CircuitOpen(UpstreamUnavailable):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f} s.")
+        self.retry_after = max(1, round(retry_after))
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    pass
+
+
+_deadline = contextvars.ContextVar('upstream_deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """Bound every upstream call made inside the block, retries and hedges included, to ``seconds`` overall."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_at():
+    """The current deadline as a ``time.monotonic()`` value, or None outside a ``deadline()`` block."""
+    return _deadline.get()
+
+
+def remaining(default=None):
+    """Seconds left before the current deadline, or ``default`` outside a ``deadline()`` block."""
+    current = _deadline.get()
+    return default if current is None else current - time.monotonic()
+
+
+def is_retryable(error):
+    # Client errors (bad request, auth, not found) will fail the same way again; rate limits will not.
+    if isinstance(error, google_exceptions.ClientError):
+        return isinstance(error, google_exceptions.TooManyRequests)
+    return True
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls for ``reset_timeout`` seconds,
+    then lets a single probe through: its success closes the circuit, its failure opens it again.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                waited = self.clock() - self.opened_at
+                if waited < self.reset_timeout:
+                    metrics.incr(f'upstream.{self.name}.rejected')
+                    raise CircuitOpen(self.name, self.reset_timeout - waited)
+                self.state = self.HALF_OPEN
+                return
+            if self.state == self.HALF_OPEN:
+                # A probe is already in flight.
+                metrics.incr(f'upstream.{self.name}.rejected')
+                raise CircuitOpen(self.name, self.reset_timeout)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.incr(f'upstream.{self.name}.opened')
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class Upstream:
+    """
+    Runs calls to one upstream service with a per-call timeout, deadline-aware retries with full jitter, a
+    hedged duplicate once a call is slower than the ``hedge_percentile`` of recent latencies, and a circuit
+    breaker. Only use it for idempotent calls, since retries and hedges repeat them.
+    """
+
+    def __init__(self, name, timeout=10.0, retries=2, backoff=0.1, max_backoff=2.0, hedge_percentile=95,
+                 hedge_min_samples=20, hedge_min_delay=0.05, failure_threshold=5, reset_timeout=30.0,
+                 max_workers=16, window=200):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self._latencies = deque(maxlen=window)
+        self._latency_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'upstream-{name}')
+
+    def hedge_delay(self):
+        """How long to wait for an attempt before sending a duplicate; None until enough latencies are known."""
+        if not self.hedge_percentile:
+            return None
+        with self._latency_lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            observed = sorted(self._latencies)
+        return max(self.hedge_min_delay, percentile(observed, self.hedge_percentile))
+
+    def call(self, fn, *args, **kwargs):
+        own_deadline = time.monotonic() + self.timeout * (self.retries + 1)
+        outer = _deadline.get()
+        deadline_at = min(own_deadline, outer) if outer is not None else own_deadline
+
+        attempt = 0
+        while True:
+            # Check the deadline first: before_call() may admit this call as the half-open probe, which must
+            # then end in record_success() or record_failure().
+            budget = min(self.timeout, deadline_at - time.monotonic())
+            if budget <= 0:
+                metrics.incr(f'upstream.{self.name}.deadline_exceeded')
+                raise DeadlineExceeded(f"{self.name} did not answer before the deadline.")
+            self.breaker.before_call()
+            try:
+                result = self._attempt(fn, args, kwargs, budget)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                pause = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if not retryable or attempt >= self.retries or time.monotonic() + pause >= deadline_at:
+                    if isinstance(e, UpstreamUnavailable) or not retryable:
+                        raise
+                    raise UpstreamUnavailable(f"{self.name} failed after {attempt + 1} attempts: {e}") from e
+                metrics.incr(f'upstream.{self.name}.retried')
+                time.sleep(pause)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _attempt(self, fn, args, kwargs, budget):
+        started = time.monotonic()
+        give_up_at = started + budget
+        futures = {self._executor.submit(fn, *args, **kwargs)}
+        hedge_after = self.hedge_delay()
+        hedged = False
+        error = None
+
+        while futures:
+            if hedge_after is not None and not hedged:
+                timeout = min(hedge_after - (time.monotonic() - started), give_up_at - time.monotonic())
+            else:
+                timeout = give_up_at - time.monotonic()
+            done, futures = wait(futures, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                with self._latency_lock:
+                    self._latencies.append(time.monotonic() - started)
+                if hedged:
+                    metrics.incr(f'upstream.{self.name}.hedge_completed')
+                return result
+
+            if time.monotonic() >= give_up_at:
+                break
+            if not done and hedge_after is not None and not hedged:
+                hedged = True
+                metrics.incr(f'upstream.{self.name}.hedged')
+                futures.add(self._executor.submit(fn, *args, **kwargs))
+
+        if error is not None and not futures:
+            raise error
+        metrics.incr(f'upstream.{self.name}.timed_out')
+        # Abandoned attempts keep their worker thread until they return; the breaker stops new ones from piling up.
+        raise DeadlineExceeded(f"{self.name} did not answer within {budget:.1f} s.")
+
+
+class Guarded:
+    """Proxy that runs every method of ``target`` through ``upstream``, e.g. ``Guarded(model, upstream('chat'))``."""
+
+    def __init__(self, target, upstream):
+        self._target = target
+        self._upstream = upstream
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def guarded(*args, **kwargs):
+            return self._upstream.call(attribute, *args, **kwargs)
+        return guarded
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(name):
+    """The process-wide Upstream for ``name``, configured from ``settings.UPSTREAM_POLICIES[name]``."""
+    with _upstreams_lock:
+        if name not in _upstreams:
+            _upstreams[name] = Upstream(name, **settings.UPSTREAM_POLICIES.get(name, {}))
+        return _upstreams[name]
+
+
+def reset():
+    """Forget every upstream's breaker state and latency history, e.g. between tests."""
+    with _upstreams_lock:
+        _upstreams.clear()
@@ -0,0 +1,70 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics
+from .features import load_model
+from .models import ShadowPrediction
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow-model')
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _acquire_slot():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.SHADOW_MAX_PENDING)
+    return _slots.acquire(blocking=False)
+
+
+def submit(features, production_score, production_version, production_ms):
+    """
+    Score ``features`` with the shadow model in the background for a sample of requests.
+
+    Never blocks and never raises: when sampling skips the request, the backlog is full or anything goes
+    wrong, the shadow evaluation is simply dropped.
+    """
+    try:
+        path = settings.SHADOW_MODEL_PATH
+        if not path or random.random() >= settings.SHADOW_SAMPLE_RATE:
+            return False
+        if not _acquire_slot():
+            metrics.incr('shadow.dropped')
+            return False
+        try:
+            _executor.submit(_score, path, features, production_score, production_version, production_ms)
+        except Exception:
+            _slots.release()
+            raise
+        return True
+    except Exception:
+        logger.exception("Could not schedule shadow prediction")
+        return False
+
+
+def _score(path, features, production_score, production_version, production_ms):
+    close_old_connections()
+    try:
+        model, version = load_model(path)
+        started = time.perf_counter()
+        shadow_score = float(model.predict_proba(features)[0][1])
+        shadow_ms = (time.perf_counter() - started) * 1000
+        ShadowPrediction.objects.create(
+            production_version=production_version, shadow_version=version,
+            production_score=production_score, shadow_score=shadow_score,
+            production_ms=production_ms, shadow_ms=shadow_ms,
+        )
+    except Exception:
+        metrics.incr('shadow.failed')
+        logger.exception("Shadow prediction failed")
+    finally:
+        _slots.release()
@@ -0,0 +1,191 @@
+import io
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import analytics
+from .api import directory
+from .models import User, Patient, Doctor, EmergencyContact
+
+PASSWORD = 'bench-password-1'
+
+GENERAL_HEALTH = ['Poor', 'Fair', 'Good', 'Very Good', 'Excellent']
+GENERAL_HEALTH_WEIGHTS = [0.04, 0.11, 0.31, 0.36, 0.18]
+CHECKUP = ['Within the past year', 'Within the past 2 years', 'Within the past 5 years', '5 or more years ago',
+           'Never']
+CHECKUP_WEIGHTS = [0.78, 0.11, 0.06, 0.04, 0.01]
+SPECIALITIES = ['Cardiology', 'Internal Medicine', 'Family Medicine', 'Endocrinology', 'Neurology']
+HOSPITALS = ['Ankara Şehir', 'Hacettepe', 'Acıbadem', 'Memorial', 'Koç Üniversitesi']
+RELATIONSHIPS = ['Spouse', 'Parent', 'Child', 'Sibling', 'Friend']
+BLOOD_TYPES = ['0+', '0-', 'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-']
+# Prevalence of each boolean Patient field.
+CONDITIONS = {'exercise': 0.77, 'heart_disease': 0.08, 'skin_cancer': 0.1, 'other_cancer': 0.1, 'depression': 0.2,
+              'diabetes': 0.13, 'arthritis': 0.33, 'smoking_history': 0.41}
+
+
+class Population:
+    """Primary keys (also the user ids) of a generated population, and its login tokens if any were created."""
+
+    def __init__(self, prefix, doctor_ids, patient_ids, tokens):
+        self.prefix = prefix
+        self.doctor_ids = doctor_ids
+        self.patient_ids = patient_ids
+        self.tokens = tokens
+
+    def doctor_username(self, i):
+        return f'{self.prefix}_doctor_{i}'
+
+    def patient_username(self, i):
+        return f'{self.prefix}_patient_{i}'
+
+
+def _reserve_ids(cursor, model, count):
+    """Claim ``count`` consecutive values from the table's id sequence, so rows can be copied with their pks."""
+    table, column = model._meta.db_table, model._meta.pk.column
+    cursor.execute("SELECT setval(pg_get_serial_sequence(%s, %s), nextval(pg_get_serial_sequence(%s, %s)) + %s)",
+                   [table, column, table, column, count - 1])
+    last = cursor.fetchone()[0]
+    return np.arange(last - count + 1, last + 1)
+
+
+def _copy(cursor, model, frame):
+    """Append ``frame``, whose columns are model field names, to the model's table with a single COPY."""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in frame.columns)
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _users(ids, kind, offset, prefix, password, now, **extra):
+    numbers = np.arange(offset, offset + len(ids))
+    usernames = [f'{prefix}_{kind}_{i}' for i in numbers]
+    return pd.DataFrame({
+        'id': ids,
+        'password': password,
+        'is_superuser': False,
+        'username': usernames,
+        'first_name': kind.capitalize(),
+        'last_name': numbers.astype(str),
+        'email': [f'{username}@example.com' for username in usernames],
+        'is_staff': False,
+        'is_active': True,
+        'date_joined': now,
+        'is_patient': kind == 'patient',
+        'is_doctor': kind == 'doctor',
+        **extra,
+    })
+
+
+def _tokens(ids, now):
+    return pd.DataFrame({'key': [Token.generate_key() for _ in ids], 'user': ids, 'created': now})
+
+
+def generate(num_doctors, num_patients, links_per_patient=3, emergency_contact_rate=0.5, prefix='synthetic',
+             tokens=False, seed=0, batch_size=50_000, rebuild_analytics=True, log=None):
+    """
+    Bulk-load ``num_doctors`` doctors and ``num_patients`` patients, with their users, emergency contacts for
+    a share of the patients and ``links_per_patient`` doctors per patient.
+
+    Values are drawn vectorised from realistic distributions and written with PostgreSQL COPY in batches of
+    ``batch_size`` patients, keeping memory bounded; 100k patients take around ten seconds. Like any
+    bulk load this bypasses signals, so the doctor directory facets are dropped afterwards and the population
+    analytics rebuilt unless ``rebuild_analytics`` is False. Every user's password is ``PASSWORD``.
+    """
+    rng = np.random.default_rng(seed)
+    password = make_password(PASSWORD)
+    now = timezone.now()
+    today = np.datetime64(date.today())
+    token_keys = {}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        doctor_ids = _reserve_ids(cursor, User, num_doctors) if num_doctors else np.arange(0)
+        if num_doctors:
+            _copy(cursor, User, _users(doctor_ids, 'doctor', 0, prefix, password, now))
+            _copy(cursor, Doctor, pd.DataFrame({
+                'user': doctor_ids,
+                'speciality': rng.choice(SPECIALITIES, num_doctors),
+                'hospital': rng.choice(HOSPITALS, num_doctors),
+                'start_date': today - rng.integers(0, 40 * 365, num_doctors).astype('timedelta64[D]'),
+                'background': 'Synthetic doctor profile.',
+            }))
+            if tokens:
+                frame = _tokens(doctor_ids, now)
+                _copy(cursor, Token, frame)
+                token_keys.update(zip(frame['user'].tolist(), frame['key']))
+            if log:
+                log(f"{num_doctors} doctors")
+
+        patient_ids = []
+        links = min(links_per_patient, num_doctors)
+        for offset in range(0, num_patients, batch_size):
+            n = min(batch_size, num_patients - offset)
+            ids = _reserve_ids(cursor, User, n)
+            patient_ids.append(ids)
+
+            age = rng.integers(18, 91, n)
+            sex = rng.choice(['Kadın', 'Erkek'], n)
+            days_old = age * 365 + rng.integers(0, 365, n)
+            _copy(cursor, User, _users(ids, 'patient', offset, prefix, password, now,
+                                       birth_date=today - days_old.astype('timedelta64[D]'), gender=sex))
+
+            has_contact = rng.random(n) < emergency_contact_rate
+            contacts = pd.array([pd.NA] * n, dtype='Int64')
+            if has_contact.any():
+                contact_ids = _reserve_ids(cursor, EmergencyContact, int(has_contact.sum()))
+                contacts[has_contact] = contact_ids
+                _copy(cursor, EmergencyContact, pd.DataFrame({
+                    'id': contact_ids,
+                    'name': [f'Contact {i}' for i in contact_ids],
+                    'phone_number': [f'+90 5{number:09d}' for number in rng.integers(0, 10 ** 9, len(contact_ids))],
+                    'relationship': rng.choice(RELATIONSHIPS, len(contact_ids)),
+                }))
+
+            height = np.clip(rng.normal(170, 10, n), 140, 210).round().astype(int)
+            weight = np.clip(rng.normal(78, 18, n), 40, 200).round().astype(int)
+            patients = pd.DataFrame({
+                'user': ids,
+                'emergency_contact': contacts,
+                'height': height,
+                'weight': weight,
+                'bmi': (weight / (height / 100) ** 2).round(1),
+                'blood_type': rng.choice(BLOOD_TYPES, n),
+                'general_health': rng.choice(GENERAL_HEALTH, n, p=GENERAL_HEALTH_WEIGHTS),
+                'checkup': rng.choice(CHECKUP, n, p=CHECKUP_WEIGHTS),
+                'sex': sex,
+                'age_category': age.astype(str),
+                'alcohol_consumption': rng.poisson(5, n),
+                'fruit_consumption': rng.integers(0, 61, n),
+                'green_vegetable_consumption': rng.integers(0, 61, n),
+                'fried_potato_consumption': rng.integers(0, 21, n),
+            })
+            for field, prevalence in CONDITIONS.items():
+                patients[field] = rng.random(n) < prevalence
+            _copy(cursor, Patient, patients)
+
+            if links:
+                # Consecutive doctors from a random start: distinct per patient and evenly spread over doctors.
+                start = rng.integers(0, num_doctors, n)
+                picked = (start[:, None] + np.arange(links)) % num_doctors
+                _copy(cursor, Doctor.patients.through, pd.DataFrame({
+                    'doctor': doctor_ids[picked.ravel()],
+                    'patient': np.repeat(ids, links),
+                }))
+            if tokens:
+                frame = _tokens(ids, now)
+                _copy(cursor, Token, frame)
+                token_keys.update(zip(frame['user'].tolist(), frame['key']))
+            if log:
+                log(f"{offset + n} / {num_patients} patients")
+
+    directory.invalidate_facets()
+    if rebuild_analytics:
+        analytics.rebuild()
+    patient_ids = np.concatenate(patient_ids) if patient_ids else np.arange(0)
+    return Population(prefix, doctor_ids, patient_ids, token_keys)
@@ -1,3 +1,932 @@
-from django.test import TestCase
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from google.api_core.exceptions import InvalidArgument
+from rest_framework.exceptions import Throttled
+from rest_framework.permissions import AllowAny
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from api import db_router
+from users import (analytics, batch_scoring, benchmark, chat, explain, metrics, rescoring, resilience, shadow,
+                   translation, vitals)
+from users.api import fragments, throttling, urls
+from users.api.views import DoctorDirectoryView
+from users.fakes import FakeChatModel, FakeRiskModel, FakeTranslationClient
+from users.models import (ChatSession, CohortStats, Doctor, DoctorStats, Patient, RescoreJob, ShadowPrediction,
+                          User, VitalsMeasurement, VitalsRollup)
+
+# Every route in users/api/urls.py: (queries, memory ceiling in KiB, extra KiB allowed per item in the lists of
+# the response). Measured with cold caches; the query counts must not change with the size of the data.
+BUDGETS = {
+    'doctor_signup': (11, 512, 0),
+    'patient_signup': (12, 512, 0),
+    'auth_token': (2, 256, 0),
+    'logout': (2, 256, 0),
+    'doctor_dashboard': (3, 512, 4),
+    'patient_dashboard': (2, 512, 0),
+    'add_doctor_to_patient': (6, 256, 0),
+    'add_patient_to_doctor': (7, 256, 0),
+    'list_doctors_of_patient': (4, 512, 4),
+    'list_patients_of_doctor': (3, 512, 16),
+    'list_all_patients': (3, 512, 16),
+    'doctor_directory': (4, 512, 4),
+    # Updates save in one transaction, a savepoint pair under TestCase.
+    'update_doctor': (8, 512, 4),
+    'update_patient': (21, 512, 0),
+    'vitals_trend': (3, 256, 4),
+    'population_analytics': (3, 512, 4),
+    'is_patient': (1, 256, 0),
+    'predict_heart_disease': (3, 256, 0),
+    # Cold caches include sampling the population background: a key range lookup, then up to
+    # explain.BACKGROUND_ROWS patients by primary key.
+    'explain_heart_disease': (4, 1536, 0),
+    'chatbot': (8, 512, 0),
+    'metrics': (1, 256, 0),
+}
+
+
+def list_items(data):
+    if isinstance(data, dict):
+        return sum(list_items(value) for value in data.values())
+    if isinstance(data, list):
+        return len(data) + sum(list_items(value) for value in data)
+    return 0
+
+
+class RouteBudgetMixin:
+    """
+    Sends the benchmark's request for every route against a synthetic population of the subclass's size, so
+    N+1 queries and per-row memory growth fail here rather than in production.
+    """
+    doctors = None
+    patients = None
+    links = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        stack = ExitStack()
+        stack.enter_context(benchmark.fake_upstreams())
+        stack.enter_context(benchmark.unthrottled())
+        cls.addClassCleanup(stack.close)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(cls.doctors, cls.patients, cls.links, spare_tokens=10)
+
+    def prepare(self, name):
+        if name in ('add_doctor_to_patient', 'add_patient_to_doctor'):
+            # Always measure adding a new link rather than re-adding an existing one.
+            Doctor.patients.through.objects.filter(doctor__user__username=self.fixture.doctor(1)[0],
+                                                   patient__user__username=self.fixture.patient(1)[0]).delete()
+
+    def send(self, name):
+        method, payload, token = benchmark.SCENARIOS[name](self.fixture, 1)
+        client = APIClient()
+        if token:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        for cache in caches.all():
+            cache.clear()
+        return getattr(client, method)(reverse(name), payload, format='json')
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns}, set(BUDGETS))
+
+    def test_query_counts(self):
+        for name, (queries, _, _) in BUDGETS.items():
+            with self.subTest(route=name):
+                self.prepare(name)
+                with self.assertNumQueries(queries):
+                    response = self.send(name)
+                self.assertLess(response.status_code, 400, response.data)
+
+    def test_memory_ceilings(self):
+        for name, (_, ceiling_kb, per_item_kb) in BUDGETS.items():
+            with self.subTest(route=name):
+                # The first call pays for lazy imports and module-level setup.
+                self.send(name)
+                self.prepare(name)
+                tracemalloc.start()
+                try:
+                    response = self.send(name)
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+                self.assertLess(response.status_code, 400, response.data)
+                ceiling = (ceiling_kb + per_item_kb * list_items(response.data)) * 1024
+                self.assertLessEqual(peak, ceiling, f"peak {peak / 1024:.0f} KiB")
+
+
+class SmallPopulationBudgetTests(RouteBudgetMixin, TestCase):
+    doctors = 4
+    patients = 40
+
+
+class MediumPopulationBudgetTests(RouteBudgetMixin, TestCase):
+    doctors = 20
+    patients = 400
+
+
+class LargePopulationBudgetTests(RouteBudgetMixin, TestCase):
+    doctors = 50
+    patients = 1500
+
+
+class UpstreamTests(SimpleTestCase):
+    def upstream(self, **policy):
+        policy = {'timeout': 1.0, 'retries': 2, 'backoff': 0.01, 'hedge_min_samples': 5, **policy}
+        return resilience.Upstream('test', **policy)
+
+    def test_retries_recover_from_transient_failures(self):
+        model = FakeChatModel()
+        model.fail_next = 2
+        result = self.upstream().call(model.generate_content, [])
+        self.assertEqual(result.text, model.answer)
+        self.assertEqual(model.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        model = FakeChatModel(error=InvalidArgument)
+        model.fail_next = 1
+        with self.assertRaises(InvalidArgument):
+            self.upstream().call(model.generate_content, [])
+        self.assertEqual(model.calls, 1)
+
+    def test_slow_call_is_hedged(self):
+        model = FakeChatModel(latency=0.01, slow_latency=2.0)
+        upstream = self.upstream(hedge_min_delay=0.01)
+        for _ in range(5):
+            upstream.call(model.generate_content, [])
+        model.slow_next = 1
+        started = time.monotonic()
+        upstream.call(model.generate_content, [])
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(model.calls, 7)
+
+    def test_breaker_fails_fast_then_probes(self):
+        model = FakeChatModel(failure_rate=1.0)
+        upstream = self.upstream(retries=0, failure_threshold=2, reset_timeout=0.1)
+        for _ in range(2):
+            with self.assertRaises(resilience.UpstreamUnavailable):
+                upstream.call(model.generate_content, [])
+        with self.assertRaises(resilience.CircuitOpen):
+            upstream.call(model.generate_content, [])
+        self.assertEqual(model.calls, 2)
+
+        time.sleep(0.1)
+        model.failure_rate = 0.0
+        upstream.call(model.generate_content, [])
+        self.assertEqual(upstream.breaker.state, resilience.CircuitBreaker.CLOSED)
+
+    def test_expired_deadline_does_not_strand_the_probe(self):
+        model = FakeChatModel(failure_rate=1.0)
+        upstream = self.upstream(retries=0, failure_threshold=1, reset_timeout=0.05)
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            upstream.call(model.generate_content, [])
+        time.sleep(0.05)
+        with resilience.deadline(0), self.assertRaises(resilience.DeadlineExceeded):
+            upstream.call(model.generate_content, [])
+
+        model.failure_rate = 0.0
+        for _ in range(3):
+            upstream.call(model.generate_content, [])
+        self.assertEqual(upstream.breaker.state, resilience.CircuitBreaker.CLOSED)
+
+    def test_deadline_bounds_retries(self):
+        model = FakeChatModel(latency=0.2, failure_rate=1.0)
+        started = time.monotonic()
+        with resilience.deadline(0.3), self.assertRaises(resilience.UpstreamUnavailable):
+            self.upstream(retries=5, backoff=0.0).call(model.generate_content, [])
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertLessEqual(model.calls, 2)
+
+
+class ChatbotResilienceTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        stack = ExitStack()
+        stack.enter_context(benchmark.fake_upstreams())
+        stack.enter_context(benchmark.unthrottled())
+        cls.addClassCleanup(stack.close)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(2, 4, 1)
+
+    def setUp(self):
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+
+    def test_unavailable_model_returns_503(self):
+        method, payload, token = benchmark.SCENARIOS['chatbot'](self.fixture, 0)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        with mock.patch('users.api.views.chat_model', FakeChatModel(failure_rate=1.0)), \
+                self.settings(UPSTREAM_POLICIES={'chat': {'retries': 0, 'failure_threshold': 1}}):
+            response = client.post(reverse('chatbot'), payload, format='json')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response)
+            response = client.post(reverse('chatbot'), payload, format='json')
+            self.assertEqual(response.status_code, 503)
+        # Failed first messages leave no empty sessions behind.
+        self.assertFalse(ChatSession.objects.exists())
+
+    def test_oversized_message_does_not_request_a_summary(self):
+        user = Patient.objects.select_related('user').first().user
+        model = FakeChatModel()
+        session = chat.create_session(user)
+        self.assertEqual(chat.compact(session, [], settings.CHAT_CONTEXT_TOKENS + 1, model), [])
+        self.assertEqual(model.calls, 0)
+
+    def test_oversized_message_is_rejected_before_any_upstream_call(self):
+        method, payload, token = benchmark.SCENARIOS['chatbot'](self.fixture, 0)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        model = FakeChatModel()
+        with mock.patch('users.api.views.chat_model', model):
+            response = client.post(reverse('chatbot'), {'message': 'x' * (chat.max_message_tokens() + 1) * 4},
+                                   format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(model.calls, 0)
+        self.assertFalse(ChatSession.objects.exists())
+
+    def test_summary_prompt_is_capped(self):
+        user = Patient.objects.select_related('user').first().user
+        session = chat.create_session(user)
+        session.summary = 'Earlier advice.'
+        long_answer = 'y' * settings.CHAT_CONTEXT_TOKENS * 8
+        chat.record_exchange(session, 'hello', long_answer)
+        chat.record_exchange(session, 'latest question', 'latest answer')
+        prompts = []
+        model = FakeChatModel()
+        model.generate_content = lambda text: prompts.append(text) or SimpleNamespace(text='Summary.')
+
+        turns = chat.compact(session, list(session.turns.order_by('pk')), 10, model)
+        self.assertEqual([turn.text for turn in turns], ['latest question', 'latest answer'])
+        self.assertLessEqual(len(prompts[0]), len(chat.SUMMARY_PROMPT) + settings.CHAT_CONTEXT_TOKENS * 4)
+        # The earlier summary and the newest folded text survive the cut.
+        self.assertIn('Earlier advice.', prompts[0])
+        self.assertTrue(prompts[0].endswith('y'))
+
+
+class DoctorDirectoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(12, 4, 1)
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.fixture.patient(0)[1]}')
+
+    def get(self, url=None, **params):
+        response = self.client.get(url or reverse('doctor_directory'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_filters_match_queryset(self):
+        doctor = Doctor.objects.select_related('user').first()
+        data = self.get(speciality=doctor.speciality, hospital=doctor.hospital, q=doctor.user.username.upper())
+        self.assertEqual([row['username'] for row in data['results']], [doctor.user.username])
+
+        experienced = self.get(min_years=10, page_size=100)['results']
+        self.assertTrue(experienced)
+        self.assertTrue(all(row['start_date'] <= self.years_ago(10) for row in experienced))
+
+    def test_cursor_pages_cover_every_doctor_once(self):
+        usernames, url = [], None
+        while True:
+            data = self.get(url, page_size=5) if url is None else self.get(url)
+            usernames += [row['username'] for row in data['results']]
+            if not data['next']:
+                break
+            url = data['next']
+        self.assertEqual(usernames, sorted(Doctor.objects.values_list('user__username', flat=True)))
+
+    def test_facets_follow_doctor_saves(self):
+        counts = {row['value']: row['doctors'] for row in self.get()['facets']['speciality']}
+        self.assertEqual(sum(counts.values()), 12)
+        with self.assertNumQueries(2):
+            self.get()
+
+        doctor = Doctor.objects.first()
+        doctor.speciality = 'Oncology'
+        doctor.save()
+        counts = {row['value']: row['doctors'] for row in self.get()['facets']['speciality']}
+        self.assertEqual(counts['Oncology'], 1)
+
+    def test_invalid_experience_is_rejected(self):
+        response = self.client.get(reverse('doctor_directory'), {'min_years': 'many'})
+        self.assertEqual(response.status_code, 400)
+
+    @staticmethod
+    def years_ago(years):
+        return DoctorDirectoryView.years_ago('min_years', years).isoformat()
+
+
+class FragmentInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(2, 4, 1)
+
+    def setUp(self):
+        caches[fragments.CACHE_ALIAS].clear()
+        self.patient = Patient.objects.select_related('user').first()
+        self.doctor = self.patient.doctors.first()
+
+    def test_saves_replace_fragments(self):
+        self.assertEqual(fragments.get_many('patient', [self.patient.pk])[0]['weight'], self.patient.weight)
+        self.patient.weight += 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.save()
+        self.assertEqual(fragments.get_many('patient', [self.patient.pk])[0]['weight'], self.patient.weight)
+
+        self.patient.user.first_name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.user.save()
+        self.assertEqual(fragments.get_many('patient', [self.patient.pk])[0]['user']['first_name'], 'Renamed')
+
+    def test_links_and_deletes_replace_doctor_fragments(self):
+        def patients():
+            return fragments.get_many('doctor', [self.doctor.pk])[0]['patients']
+
+        self.assertIn(self.patient.pk, patients())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.patients.remove(self.patient)
+        self.assertNotIn(self.patient.pk, patients())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.doctors.add(self.doctor)
+        self.assertIn(self.patient.pk, patients())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.doctors.clear()
+        self.assertNotIn(self.patient.pk, patients())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.doctors.add(self.doctor)
+        self.assertIn(self.patient.pk, patients())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.delete()
+        self.assertNotIn(self.patient.pk, patients())
+
+    def test_versions_move_only_once_the_write_commits(self):
+        version_key = fragments._version_key('patient', self.patient.pk)
+        fragments.get_many('patient', [self.patient.pk])
+        before = caches[fragments.CACHE_ALIAS].get(version_key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.patient.save()
+            self.assertEqual(caches[fragments.CACHE_ALIAS].get(version_key), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(caches[fragments.CACHE_ALIAS].get(version_key), before)
+
+    def test_invalidation_during_a_miss_is_not_lost(self):
+        serializer_class, load = fragments.KINDS['patient']
+
+        def load_then_race(pks):
+            stale = list(load(pks))
+            Patient.objects.filter(pk__in=pks).update(weight=200)
+            fragments.invalidate('patient', pks)
+            return stale
+
+        with mock.patch.dict(fragments.KINDS, {'patient': (serializer_class, load_then_race)}):
+            with self.captureOnCommitCallbacks(execute=True):
+                stale = fragments.get_many('patient', [self.patient.pk])
+            self.assertEqual(stale[0]['weight'], self.patient.weight)
+        self.assertEqual(fragments.get_many('patient', [self.patient.pk])[0]['weight'], 200)
+
+    def test_misses_are_loaded_from_the_primary(self):
+        token = db_router._use_replica.set(True)
+        self.addCleanup(db_router._use_replica.reset, token)
+        with mock.patch('api.db_router.replica_aliases', return_value=['lagging_replica']):
+            self.assertEqual(len(fragments.get_many('doctor', [self.doctor.pk])), 1)
+
+
+@override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'test_user': '5/min', 'test_global': '20/min'}},
+                   MAX_IN_FLIGHT={'test': 2})
+class ThrottleTests(SimpleTestCase):
+    class View(throttling.ScopedThrottleMixin, throttling.InFlightLimitMixin, APIView):
+        permission_classes = [AllowAny]
+        throttle_scope = 'test'
+
+    def setUp(self):
+        caches['default'].clear()
+        # Start of a window with nothing counted in the previous one.
+        patcher = mock.patch.object(throttling.SlidingWindowThrottle, 'timer', return_value=600.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, user_pk=1):
+        return SimpleNamespace(user=SimpleNamespace(pk=user_pk, is_authenticated=True))
+
+    def allowed(self, throttle_class, user_pk=1):
+        return throttle_class().allow_request(self.request(user_pk), self.View())
+
+    def test_concurrent_requests_cannot_exceed_the_limit(self):
+        results = []
+        barrier = threading.Barrier(20)
+
+        def send():
+            barrier.wait()
+            results.append(self.allowed(throttling.GlobalRateThrottle))
+        threads = [threading.Thread(target=send) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 20)
+        throttle = throttling.GlobalRateThrottle()
+        self.assertFalse(throttle.allow_request(self.request(), self.View()))
+        # The 20 counted requests weigh 20 * (1 - elapsed) in the next window: room for one more at 1/20.
+        self.assertAlmostEqual(throttle.wait(), 63.0)
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        for _ in range(5):
+            self.assertTrue(self.allowed(throttling.UserRateThrottle))
+        self.assertFalse(self.allowed(throttling.UserRateThrottle))
+        # Halfway into the next window, half of the previous window's 5 requests still count.
+        throttling.SlidingWindowThrottle.timer.return_value = 690.0
+        self.assertEqual([self.allowed(throttling.UserRateThrottle) for _ in range(3)], [True, True, False])
+
+    def test_rejected_requests_are_refunded_to_the_other_limits(self):
+        view = self.View()
+        with override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'test_user': '5/min',
+                                                                          'test_global': '1/min'}}):
+            view.check_throttles(self.request(user_pk=1))
+            for _ in range(3):
+                with self.assertRaises(Throttled):
+                    view.check_throttles(self.request(user_pk=2))
+        self.assertEqual(caches['default'].get('throttle_test_user_2_10'), 0)
+        self.assertEqual(caches['default'].get('throttle_test_global_all_10'), 1)
+
+    def acquire(self):
+        view = self.View()
+        request = view.initialize_request(RequestFactory().get('/'))
+        view.format_kwarg = None
+        view.initial(request)
+        return view
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {}})
+    def test_in_flight_counter_survives_expiry(self):
+        first = self.acquire()
+        second = self.acquire()
+        with self.assertRaises(Throttled):
+            self.acquire()
+
+        # The counter expires while both requests are still in flight.
+        caches['default'].delete('in_flight_test')
+        third = self.acquire()
+        for view in (first, second, third):
+            view._release(view._in_flight_key)
+        self.assertEqual(caches['default'].get('in_flight_test'), 0)
+        self.acquire()
+        self.acquire()
+        with self.assertRaises(Throttled):
+            self.acquire()
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {}})
+    def test_in_flight_slot_is_released_when_the_handler_raises(self):
+        class Failing(self.View):
+            def get(self, request):
+                raise RuntimeError('boom')
+
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                Failing.as_view()(RequestFactory().get('/'))
+        self.assertEqual(caches['default'].get('in_flight_test'), 0)
+
+
+class PatientAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('root', 'root@example.com', 'secret')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def rescore(self):
+        return self.client.post(reverse('admin:users_patient_changelist'),
+                                {'action': 'rescore_all_patients', 'index': 0}, follow=True)
+
+    def test_rescore_all_needs_no_selection(self):
+        with mock.patch('users.rescoring.load_model', return_value=(FakeRiskModel(), 'v1')), \
+                mock.patch('users.rescoring.run_job_in_background') as run:
+            response = self.rescore()
+        job = RescoreJob.objects.get()
+        run.assert_called_once_with(job, claimed=True)
+        self.assertEqual([str(message) for message in response.context['messages']], [f"Started {job}."])
+
+    def test_model_load_errors_are_reported(self):
+        with mock.patch('users.rescoring.load_model', side_effect=FileNotFoundError('trained_model.pkl')):
+            response = self.rescore()
+        self.assertFalse(RescoreJob.objects.exists())
+        self.assertEqual([str(message) for message in response.context['messages']],
+                         ["Could not load the deployed model: trained_model.pkl"])
+
+
+class ReadReplicaMixinTests(SimpleTestCase):
+    class View(db_router.ReadReplicaMixin, APIView):
+        authentication_classes = []
+        permission_classes = [AllowAny]
+
+        def get(self, request):
+            raise RuntimeError('boom')
+
+    def test_replica_routing_is_reset_when_the_handler_raises(self):
+        with self.assertRaises(RuntimeError):
+            self.View.as_view()(RequestFactory().get('/'))
+        self.assertFalse(db_router._use_replica.get())
+
+
+class RescoreLeaseTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(benchmark.fake_upstreams().close)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(2, 4, 1)
+
+    def test_running_job_is_claimable_only_once_stale(self):
+        job = rescoring.start_job()
+        self.assertFalse(rescoring.claim(job))
+        RescoreJob.objects.filter(pk=job.pk).update(
+            updated_at=job.updated_at - timedelta(seconds=rescoring.LEASE_SECONDS + 1))
+        self.assertTrue(rescoring.claim(job))
+        self.assertFalse(rescoring.claim(job))
+
+    def test_finished_job_is_not_claimable(self):
+        job = rescoring.run_job(rescoring.start_job(), max_duty=1, claimed=True)
+        self.assertEqual(job.status, RescoreJob.DONE)
+        self.assertFalse(rescoring.claim(job))
+        self.assertFalse(Patient.objects.filter(risk_scored_at__isnull=True).exists())
+
+    def test_worker_stops_once_taken_over(self):
+        job = rescoring.start_job()
+        # Another worker claimed the job after it was presumed dead.
+        RescoreJob.objects.filter(pk=job.pk).update(updated_at=job.updated_at + timedelta(seconds=1))
+        with self.assertRaises(rescoring.LeaseLost):
+            rescoring.run_job(job, max_duty=1, claimed=True)
+        self.assertEqual(RescoreJob.objects.get(pk=job.pk).status, RescoreJob.RUNNING)
+        self.assertFalse(Patient.objects.filter(risk_scored_at__isnull=False).exists())
+
+
+class PatientUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(1, 1, 1)
+
+    def test_risk_fields_cannot_be_set_by_the_patient(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.fixture.patient(0)[1]}')
+        response = client.put(reverse('update_patient'), {'weight': 70, 'heart_disease_risk': 0.01,
+                                                          'risk_model_version': 'forged'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        patient = Patient.objects.get()
+        self.assertEqual(patient.weight, 70)
+        self.assertIsNone(patient.heart_disease_risk)
+        self.assertNotEqual(patient.risk_model_version, 'forged')
+
+
+class VitalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(1, 1, 1)
+
+    def setUp(self):
+        self.patient = Patient.objects.get()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.fixture.patient(0)[1]}')
+
+    def record(self, weight, bmi, recorded_at):
+        self.patient.weight, self.patient.bmi = weight, bmi
+        vitals.record_vitals(self.patient, recorded_at)
+
+    def test_rollups_track_count_min_max_and_average(self):
+        start = timezone.now().replace(year=2026, month=3, day=10, hour=8, minute=0)
+        self.record(70, 24.0, start)
+        self.record(74, 25.5, start + timedelta(minutes=30))
+        self.record(66, 22.5, start + timedelta(days=1))
+
+        hours = VitalsRollup.objects.filter(patient=self.patient, period=VitalsRollup.HOUR).order_by('bucket')
+        self.assertEqual([(row.count, row.weight_min, row.weight_max) for row in hours], [(2, 70, 74), (1, 66, 66)])
+        month = VitalsRollup.objects.get(patient=self.patient, period=VitalsRollup.MONTH)
+        self.assertEqual((month.count, month.weight_min, month.weight_max, month.bmi_min, month.bmi_max),
+                         (3, 66, 74, 22.5, 25.5))
+
+        response = self.client.get(reverse('vitals_trend'), {'period': 'day'})
+        self.assertEqual([(row['count'], row['weight_avg'], row['bmi_avg']) for row in response.data],
+                         [(2, 72.0, 24.75), (1, 66.0, 22.5)])
+
+    def test_out_of_range_vitals_are_rejected_before_saving(self):
+        response = self.client.put(reverse('update_patient'), {'weight': 40000}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('weight', response.data)
+        self.assertEqual(Patient.objects.get().weight, self.patient.weight)
+        self.assertFalse(VitalsMeasurement.objects.exists())
+
+    def test_failed_snapshot_undoes_the_update(self):
+        with mock.patch('users.api.views.record_vitals', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            self.client.put(reverse('update_patient'), {'weight': self.patient.weight + 5}, format='json')
+        self.assertEqual(Patient.objects.get().weight, self.patient.weight)
+
+
+@override_settings(SHADOW_MODEL_PATH='shadow.pkl', SHADOW_SAMPLE_RATE=0.5, SHADOW_MAX_PENDING=2)
+class ShadowTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        # A fresh backlog, and an executor that never runs anything so slots stay taken.
+        for name, value in (('_slots', None), ('_executor', mock.Mock())):
+            patcher = mock.patch.object(shadow, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def submit(self, sample):
+        with mock.patch('users.shadow.random.random', return_value=sample):
+            return shadow.submit(pd.DataFrame([{}]), 0.5, 'prod', 1.0)
+
+    def test_only_sampled_requests_are_scored(self):
+        self.assertFalse(self.submit(0.5))
+        self.assertTrue(self.submit(0.4))
+        self.assertEqual(shadow._executor.submit.call_count, 1)
+
+    def test_full_backlog_drops_requests_without_raising(self):
+        self.assertEqual([self.submit(0) for _ in range(4)], [True, True, False, False])
+        self.assertEqual(metrics.snapshot()['shadow.dropped'], 2)
+
+        shadow._executor.submit.side_effect = RuntimeError('shut down')
+        shadow._slots.release()
+        with self.assertLogs('users.shadow', 'ERROR'):
+            self.assertFalse(self.submit(0))
+        # The failed submission gave its slot back.
+        self.assertTrue(shadow._slots.acquire(blocking=False))
+
+    def test_report_summarises_agreement_and_latency(self):
+        for production, candidate, production_ms, shadow_ms in ((0.6, 0.7, 10, 5), (0.4, 0.6, 20, 10),
+                                                                (0.2, 0.1, 30, 15)):
+            ShadowPrediction.objects.create(production_version='prod', shadow_version='cand',
+                                            production_score=production, shadow_score=candidate,
+                                            production_ms=production_ms, shadow_ms=shadow_ms)
+        out = StringIO()
+        call_command('shadow_report', stdout=out)
+        report = out.getvalue()
+        self.assertIn("Predictions:        3", report)
+        self.assertIn("Model versions:     prod -> cand", report)
+        self.assertIn("Label agreement:    66.67% at threshold 0.5", report)
+        self.assertIn("Score delta:        mean +0.0667, mean abs 0.1333, max abs 0.2000", report)
+        self.assertIn("Production latency: p50 20.00 ms, p95 30.00 ms, p99 30.00 ms", report)
+        self.assertIn("Shadow latency:     p50 10.00 ms, p95 15.00 ms, p99 15.00 ms", report)
+        self.assertIn("shadow runs 2.00x as fast", report)
+
+    def test_report_without_predictions_fails(self):
+        with self.assertRaises(CommandError):
+            call_command('shadow_report', stdout=StringIO())
+
+
+class BatchScoringTests(SimpleTestCase):
+    ROW = {'general_health': 'Good', 'exercise': 'Yes', 'skin_cancer': 'No', 'other_cancer': 'No',
+           'depression': 'No', 'diabetes': 'No', 'arthritis': 'No', 'age_category': '54', 'height': 170,
+           'weight': 80, 'bmi': 27.7, 'smoking_history': 'No', 'alcohol_consumption': 4, 'fruit_consumption': 30,
+           'green_vegetable_consumption': 12, 'fried_potato_consumption': 4, 'checkup': 'Within the past year',
+           'sex': 'Kadın'}
+
+    def test_unscorable_rows_are_nan_rather_than_fatal(self):
+        raw = pd.DataFrame([self.ROW, {**self.ROW, 'bmi': 'n/a'}, {**self.ROW, 'alcohol_consumption': 'lots'},
+                            {**self.ROW, 'exercise': 'maybe'}, {**self.ROW, 'height': ''}, self.ROW], dtype=object)
+        risk = batch_scoring.score_frame(raw, FakeRiskModel())
+        self.assertEqual(np.isfinite(risk).tolist(), [True, False, False, False, False, True])
+        self.assertEqual(risk[0], risk[-1])
+
+    def test_resume_skips_parsed_rows_across_chunks(self):
+        path = self.enterContext(tempfile.TemporaryDirectory()) + '/input.csv'
+        pd.DataFrame({'id': range(7), 'note': ['line one\nline two'] * 7}).to_csv(path, index=False)
+        chunks = list(batch_scoring.read_chunks(path, 3, ['id', 'note'], skip=4))
+        self.assertEqual([chunk['id'].tolist() for chunk in chunks], [[4, 5], [6]])
+
+    def test_completed_rows_counts_records_and_cuts_a_partial_one(self):
+        path = self.enterContext(tempfile.TemporaryDirectory()) + '/output.csv'
+        pd.DataFrame({'id': ['a\nb', 'c'], 'heart_disease_risk': [0.1, 0.2], 'model_version': 'v1'}).to_csv(
+            path, index=False)
+        with open(path, 'rb') as f:
+            complete = f.read()
+        with open(path, 'ab') as f:
+            f.write(b'"d\ne",0.3')
+
+        self.assertEqual(batch_scoring.completed_rows(path, 'v1'), 2)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), complete)
+        with self.assertRaises(ValueError):
+            batch_scoring.completed_rows(path, 'v2')
+
+
+class ExplanationTests(SimpleTestCase):
+    def test_linear_contributions_are_relative_to_the_background(self):
+        model = FakeRiskModel()
+        background = pd.DataFrame({'Age_Category': [4, 8], 'General_Health': [2, 2], 'BMI_Category': [1, 3]})
+        means = explain.background_means(model, background)
+        X = pd.DataFrame({'Age_Category': [10], 'General_Health': [2], 'BMI_Category': [2]})
+
+        units, base, values = explain.contributions(model, X, means)
+        self.assertEqual(units, 'log-odds')
+        self.assertAlmostEqual(values['Age_Category'], 0.04 * (10 - 6))
+        # A feature at the background mean contributes nothing, however large its raw value.
+        self.assertEqual(values['General_Health'], 0)
+        self.assertEqual(values['BMI_Category'], 0)
+        positive = model.predict_proba(X)[0, 1]
+        self.assertAlmostEqual(base + sum(values.values()), np.log(positive / (1 - positive)))
+
+    def test_stored_feature_means_take_precedence(self):
+        model = FakeRiskModel()
+        model.feature_means_ = np.array([1.0, 2.0, 3.0])
+        means = explain.background_means(model, None)
+        self.assertEqual(means.to_dict(), {'Age_Category': 1.0, 'General_Health': 2.0, 'BMI_Category': 3.0})
+
+    def test_unsupported_models_are_reported(self):
+        with self.assertRaises(explain.UnsupportedModel):
+            explain.contributions(object(), pd.DataFrame({'Age_Category': [1]}))
+
+
+class BackgroundSampleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(3, 20, 1)
+
+    def test_sample_probes_primary_keys_instead_of_sorting(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(explain._sample_patients(explain.BACKGROUND_ROWS))
+        self.assertEqual(len(rows), Patient.objects.count())
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(any('RANDOM()' in query['sql'] for query in queries.captured_queries))
+
+    def test_sample_is_capped_by_the_probes(self):
+        self.assertLessEqual(len(explain._sample_patients(5)), 5)
+
+    def test_empty_population_has_no_sample(self):
+        User.objects.filter(patient__isnull=False).delete()
+        self.assertEqual(explain._sample_patients(10), [])
+
+
+class TranslationTests(SimpleTestCase):
+    def setUp(self):
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+
+    def test_split_segments_round_trips(self):
+        long_paragraph = ' '.join(['Bu uzun bir cümle.'] * 80)
+        for text in ['', 'Merhaba', 'Bir.\n\nİki.\n', '\n\n**Not:**\n', long_paragraph + '\n\n' + long_paragraph]:
+            with self.subTest(text=text[:20]):
+                parts, is_text = translation.split_segments(text, max_chars=100)
+                self.assertEqual(''.join(parts), text)
+                self.assertFalse(any(flag and not part.strip() for part, flag in zip(parts, is_text)))
+                self.assertTrue(all(len(part) <= 100 for part, flag in zip(parts, is_text) if flag))
+
+    def test_needs_translation(self):
+        self.assertFalse(translation.needs_translation('** 120/80 **', translation.TR))
+        self.assertFalse(translation.needs_translation('Kalp sağlığım için ne yapmalıyım?', translation.TR))
+        self.assertTrue(translation.needs_translation('What should I do for my heart?', translation.TR))
+        self.assertFalse(translation.needs_translation('What should I do for my heart?', translation.EN))
+
+    def test_concurrent_callers_share_one_request(self):
+        client = FakeTranslationClient(latency=0.01)
+        batcher = translation.TranslationBatcher(client=client, max_wait=0.2)
+        results = {}
+        barrier = threading.Barrier(8)
+
+        def send(i):
+            barrier.wait()
+            results[i] = batcher.translate([f'text {i}', f'more {i}'], translation.TR, translation.EN)
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {i: [f'text {i}', f'more {i}'] for i in range(8)})
+        self.assertEqual(client.calls, 1)
+
+    def test_caller_deadline_reaches_the_sender(self):
+        batcher = translation.TranslationBatcher(client=FakeTranslationClient())
+        seen = []
+        call = resilience.Upstream.call
+
+        def record(upstream, *args, **kwargs):
+            seen.append(resilience.remaining())
+            return call(upstream, *args, **kwargs)
+        with mock.patch.object(resilience.Upstream, 'call', record), resilience.deadline(2):
+            batcher.translate(['Merhaba'], translation.TR, translation.EN)
+        self.assertEqual(len(seen), 1)
+        self.assertIsNotNone(seen[0])
+        self.assertLessEqual(seen[0], 2)
+
+
+class AnalyticsDeltaTests(TestCase):
+    """Every kind of change, applied through the signal deltas, must leave the same summaries as rebuild()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = benchmark.seed(3, 12, 2)
+
+    def summaries(self):
+        cohorts = {(row.pop('age_group'), row.pop('sex')): {key: round(value, 6) for key, value in row.items()}
+                   for row in CohortStats.objects.values().order_by()
+                   if row.pop('id') and row.pop('updated_at') and row['patients']}
+        doctors = {row['doctor_id']: (row['patients'], round(row['bmi_sum'], 6))
+                   for row in DoctorStats.objects.values('doctor_id', 'patients', 'bmi_sum')}
+        return cohorts, doctors
+
+    def assertMatchesRebuild(self):
+        incremental = self.summaries()
+        analytics.rebuild()
+        self.assertEqual(incremental, self.summaries())
+
+    def patient(self, i=0):
+        return Patient.objects.order_by('pk')[i]
+
+    def test_saves_move_patients_between_cohorts(self):
+        patient = self.patient()
+        patient.age_category = '85' if patient.age_category != '85' else '30'
+        patient.sex = 'Erkek' if patient.sex == 'Kadın' else 'Kadın'
+        patient.diabetes = not patient.diabetes
+        patient.bmi += 3.5
+        patient.save()
+        self.assertMatchesRebuild()
+
+    def test_saves_within_a_cohort(self):
+        patient = self.patient(1)
+        patient.general_health = 'Poor' if patient.general_health != 'Poor' else 'Excellent'
+        patient.heart_disease = not patient.heart_disease
+        patient.bmi -= 1.25
+        patient.save()
+        self.assertMatchesRebuild()
+
+    def test_deferred_and_unrelated_saves(self):
+        patient = Patient.objects.only('pk', 'bmi').get(pk=self.patient(2).pk)
+        patient.bmi = 41.0
+        patient.save()
+        self.assertMatchesRebuild()
+
+        patient = self.patient(3)
+        patient.weight = 90
+        patient.save(update_fields=['weight'])
+        self.assertMatchesRebuild()
+
+        Patient.objects.only('pk').get(pk=self.patient(4).pk).delete()
+        self.assertMatchesRebuild()
+
+    def test_forward_links(self):
+        doctor = Doctor.objects.order_by('pk').first()
+        others = list(Patient.objects.exclude(doctors=doctor)[:2])
+        doctor.patients.add(*others)
+        self.assertMatchesRebuild()
+        doctor.patients.remove(others[0])
+        self.assertMatchesRebuild()
+        doctor.patients.clear()
+        self.assertMatchesRebuild()
+
+    def test_reverse_links(self):
+        patient = self.patient(4)
+        doctor = Doctor.objects.exclude(patients=patient).first()
+        patient.doctors.add(doctor)
+        self.assertMatchesRebuild()
+        patient.doctors.remove(doctor)
+        self.assertMatchesRebuild()
+        patient.doctors.clear()
+        self.assertMatchesRebuild()
+
+    def test_creates_and_deletes(self):
+        user = User.objects.create(username='analytics_new_patient', is_patient=True)
+        patient = Patient.objects.create(user=user, sex='Kadın', age_category='47', bmi=24.0, diabetes=True,
+                                         general_health='Good')
+        patient.doctors.add(*Doctor.objects.all()[:2])
+        Doctor.objects.create(user=User.objects.create(username='analytics_new_doctor', is_doctor=True))
+        self.assertMatchesRebuild()
+
+        self.patient(5).delete()
+        self.assertMatchesRebuild()
+        self.patient(6).user.delete()
+        self.assertMatchesRebuild()
+
+    def test_first_change_rebuilds_an_empty_table(self):
+        CohortStats.objects.all().delete()
+        patient = self.patient(7)
+        patient.depression = not patient.depression
+        patient.save()
+        self.assertTrue(CohortStats.objects.exists())
+        self.assertMatchesRebuild()
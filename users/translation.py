@@ -0,0 +1,189 @@
+import queue
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import nullcontext
+
+from google.cloud import translate
+
+from . import resilience
+
+EN = "en-US"
+TR = "tr"
+PROJECT_ID = "valid-flow-412916"
+
+TURKISH_CHARS = set('çğıöşüÇĞİÖŞÜ')
+TURKISH_WORDS = {'ve', 'bir', 'bu', 'şu', 'için', 'ile', 'ne', 'mi', 'mı', 'mu', 'mü', 'da', 'de', 'çok', 'ben',
+                 'sen', 'biz', 'nasıl', 'neden', 'değil', 'var', 'yok', 'gibi', 'daha', 'ama', 'veya', 'merhaba',
+                 'evet', 'hayır', 'teşekkürler', 'kalp', 'ağrı', 'ilaç', 'doktor', 'sağlık', 'yapmalıyım'}
+ENGLISH_WORDS = {'the', 'and', 'is', 'are', 'was', 'you', 'to', 'of', 'a', 'an', 'in', 'it', 'for', 'with', 'what',
+                 'how', 'why', 'should', 'your', 'my', 'this', 'that', 'be', 'can', 'not', 'do', 'have', 'if', 'or',
+                 'hello', 'thanks', 'yes', 'no', 'heart', 'pain', 'doctor', 'health'}
+
+WORD_RE = re.compile(r"[^\W\d_]+")
+PARAGRAPH_RE = re.compile(r'(\n+)')
+SENTENCE_RE = re.compile(r'(?<=[.!?])(\s+)')
+MAX_SEGMENT_CHARS = 1000
+
+
+def detect_language(text):
+    """Cheap local guess between Turkish and English; None when there is no text or no clear signal."""
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return None
+    turkish = sum(word in TURKISH_WORDS for word in words) + 2 * sum(char in TURKISH_CHARS for char in text)
+    english = sum(word in ENGLISH_WORDS for word in words)
+    if turkish > english:
+        return 'tr'
+    if english > turkish:
+        return 'en'
+    return None
+
+
+def needs_translation(text, target_language):
+    if not WORD_RE.search(text):
+        # Empty, whitespace, punctuation, numbers or markdown markers only.
+        return False
+    return detect_language(text) != target_language.split('-')[0].lower()
+
+
+def split_segments(text, max_chars=MAX_SEGMENT_CHARS):
+    """
+    Split ``text`` into paragraphs, and over-long paragraphs into sentences. Returns ``(parts, is_text)`` where
+    ``''.join(parts) == text`` and ``is_text`` marks the parts that are not separators.
+    """
+    parts, is_text = [], []
+    for i, paragraph in enumerate(PARAGRAPH_RE.split(text)):
+        pieces = SENTENCE_RE.split(paragraph) if i % 2 == 0 and len(paragraph) > max_chars else [paragraph]
+        for j, piece in enumerate(pieces):
+            if piece:
+                parts.append(piece)
+                is_text.append(i % 2 == 0 and j % 2 == 0)
+    return parts, is_text
+
+
+class _Pending:
+    def __init__(self, texts, source_language, target_language):
+        self.texts = texts
+        self.key = (source_language, target_language)
+        self.future = Future()
+        # The caller's request deadline; context variables do not follow the request to the sender thread.
+        self.deadline = resilience.deadline_at()
+
+
+class TranslationBatcher:
+    """
+    Coalesces translation requests from concurrent callers into shared ``translate_text`` calls.
+
+    Callers block on ``translate()`` while a single collector thread gathers whatever arrives within
+    ``max_wait`` seconds (up to ``max_segments`` segments or ``max_chars`` characters), groups it by language
+    pair and sends one request per pair with every segment in ``contents``.
+    """
+
+    def __init__(self, client=None, max_wait=0.005, max_segments=128, max_chars=25000, max_requests=4,
+                 timeout=30):
+        self.client = client
+        self.max_wait = max_wait
+        self.max_segments = max_segments
+        self.max_chars = max_chars
+        self.timeout = timeout
+        self.parent = f"projects/{PROJECT_ID}/locations/global"
+        self._queue = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=max_requests, thread_name_prefix='translate')
+        self._collector = None
+        self._lock = threading.Lock()
+
+    def translate(self, texts, source_language, target_language):
+        if not texts:
+            return []
+        pending = _Pending(list(texts), source_language, target_language)
+        self._start()
+        self._queue.put(pending)
+        try:
+            return pending.future.result(min(self.timeout, resilience.remaining(self.timeout)))
+        except FutureTimeoutError:
+            raise resilience.DeadlineExceeded("Translation did not answer before the deadline.")
+
+    def _start(self):
+        with self._lock:
+            if self._collector is None:
+                if self.client is None:
+                    self.client = translate.TranslationServiceClient()
+                self._collector = threading.Thread(target=self._collect, name='translate-batcher', daemon=True)
+                self._collector.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            segments = len(batch[0].texts)
+            chars = sum(map(len, batch[0].texts))
+            deadline = time.monotonic() + self.max_wait
+            while segments < self.max_segments and chars < self.max_chars:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                segments += len(pending.texts)
+                chars += sum(map(len, pending.texts))
+
+            groups = defaultdict(list)
+            for pending in batch:
+                groups[pending.key].append(pending)
+            for key, pendings in groups.items():
+                self._senders.submit(self._send, key, pendings)
+
+    def _send(self, key, pendings):
+        source_language, target_language = key
+        now = time.monotonic()
+        expired = [pending for pending in pendings if pending.deadline is not None and pending.deadline <= now]
+        for pending in expired:
+            pending.future.set_exception(resilience.DeadlineExceeded("Translation did not answer before the deadline."))
+        pendings = [pending for pending in pendings if pending not in expired]
+        if not pendings:
+            return
+
+        # Retries and hedges stop at the earliest deadline in the batch.
+        deadlines = [pending.deadline for pending in pendings if pending.deadline is not None]
+        budget = min(deadlines) - now if deadlines else None
+        try:
+            with resilience.deadline(budget) if budget is not None else nullcontext():
+                response = resilience.upstream('translation').call(
+                    self.client.translate_text,
+                    request={
+                        "parent": self.parent,
+                        "contents": [text for pending in pendings for text in pending.texts],
+                        "mime_type": "text/plain",
+                        "source_language_code": source_language,
+                        "target_language_code": target_language,
+                    }
+                )
+        except Exception as e:
+            for pending in pendings:
+                pending.future.set_exception(e)
+            return
+
+        translated = [translation.translated_text for translation in response.translations]
+        offset = 0
+        for pending in pendings:
+            pending.future.set_result(translated[offset:offset + len(pending.texts)])
+            offset += len(pending.texts)
+
+
+_batcher = TranslationBatcher()
+
+
+def translate_text(text="Hello, world!", source_language="en-US", target_language="tr"):
+    """Translate ``text`` segment by segment, skipping segments already in the target language."""
+    parts, is_text = split_segments(text)
+    todo = [i for i, part in enumerate(parts) if is_text[i] and needs_translation(part, target_language)]
+    if todo:
+        translated = _batcher.translate([parts[i] for i in todo], source_language, target_language)
+        for i, part in zip(todo, translated):
+            parts[i] = part
+    return ''.join(parts)
@@ -0,0 +1,75 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import Patient, VitalsMeasurement, VitalsRollup
+
+VITALS_FIELDS = ['height', 'weight', 'bmi', 'alcohol_consumption', 'fruit_consumption',
+                 'green_vegetable_consumption', 'fried_potato_consumption']
+
+PERIODS = {
+    'hour': VitalsRollup.HOUR,
+    'day': VitalsRollup.DAY,
+    'month': VitalsRollup.MONTH,
+}
+
+
+def bucket_start(moment, period):
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if period in (VitalsRollup.DAY, VitalsRollup.MONTH):
+        moment = moment.replace(hour=0)
+    if period == VitalsRollup.MONTH:
+        moment = moment.replace(day=1)
+    return moment
+
+
+def _increments(measurement):
+    increments = {'count': F('count') + 1}
+    for field in VITALS_FIELDS:
+        increments[f'{field}_sum'] = F(f'{field}_sum') + getattr(measurement, field)
+    for field in ('weight', 'bmi'):
+        value = Value(getattr(measurement, field))
+        increments[f'{field}_min'] = Least(f'{field}_min', value)
+        increments[f'{field}_max'] = Greatest(f'{field}_max', value)
+    return increments
+
+
+def _initial(measurement):
+    initial = {'count': 1}
+    for field in VITALS_FIELDS:
+        initial[f'{field}_sum'] = getattr(measurement, field)
+    for field in ('weight', 'bmi'):
+        initial[f'{field}_min'] = initial[f'{field}_max'] = getattr(measurement, field)
+    return initial
+
+
+def _add_to_rollup(measurement, period):
+    bucket = bucket_start(measurement.recorded_at, period)
+    rollups = VitalsRollup.objects.filter(patient_id=measurement.patient_id, period=period, bucket=bucket)
+    if rollups.update(**_increments(measurement)):
+        return
+    try:
+        with transaction.atomic():
+            VitalsRollup.objects.create(patient_id=measurement.patient_id, period=period, bucket=bucket,
+                                        **_initial(measurement))
+    except IntegrityError:
+        # A concurrent insert created the bucket first.
+        rollups.update(**_increments(measurement))
+
+
+def record_vitals(patient, recorded_at=None):
+    """
+    Append the patient's current vitals snapshot to the measurement log and fold it into the hourly, daily
+    and monthly rollups. Snapshots without height or weight are not recorded.
+    """
+    values = {field: Patient._meta.get_field(field).to_python(getattr(patient, field)) for field in VITALS_FIELDS}
+    if values['height'] is None or values['weight'] is None:
+        return None
+
+    with transaction.atomic():
+        measurement = VitalsMeasurement.objects.create(patient=patient, recorded_at=recorded_at or timezone.now(),
+                                                       **values)
+        for period, _ in VitalsRollup.PERIOD_CHOICES:
+            _add_to_rollup(measurement, period)
+    return measurement